@@ -3,6 +3,7 @@
 import logging
 import time
 import os
+import re
 import requests
 import json
 from typing import Dict, List, Any, Optional
@@ -186,7 +187,6 @@ class TelegramHandler(MessageHandler):
             content = ''.join(char for char in content if ord(char) >= 32 or ord(char) > 127)
             
             # Remove HTML tags using a comprehensive approach
-            import re
             content = re.sub(r'<[^>]*>', '', content)  # Remove HTML tags
             
             # We don't escape special characters to preserve Polish diacritics
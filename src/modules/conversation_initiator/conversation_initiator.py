@@ -201,9 +201,6 @@ class ConversationInitiator:
     
     def _calculate_freshness_score(self, discovery: Dict[str, Any]) -> float:
         """Calculate freshness score based on timestamp."""
-        import time
-        from datetime import datetime, timedelta
-        
         # If no timestamp, assume it's fresh
         timestamp = discovery.get("timestamp")
         if not timestamp:
@@ -86,6 +86,11 @@ class LearningManager:
         """
         logger.info("Starting model training")
         
+        if model_manager.model is None:
+            # Generation is served by an inference server, there are no local weights to train
+            logger.warning("No local model loaded, skipping training")
+            return {}
+        
         # Starting the training
         training_metrics = self._run_training_steps(model_manager, training_data)
         
@@ -6,6 +6,8 @@ import json
 import time
 from typing import Dict, List, Any, Optional
 
+import requests
+
 logger = logging.getLogger("SKYNET-SAFE.ExternalEvaluationManager")
 
 class ExternalEvaluationManager:
@@ -430,9 +432,6 @@ class ExternalEvaluationManager:
         Returns:
             Claude's response as a string
         """
-        import requests
-        import json
-        
         # Check if API key is available
         api_key = self.config.get("api_key")
         if not api_key:
@@ -4,10 +4,67 @@ import logging
 import os
 import json
 import time
-from typing import Dict, List, Any, Optional
+from collections import defaultdict, deque
+from typing import Dict, List, Any, Optional, TypedDict
+
+import numpy as np
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger("SKYNET-SAFE.SelfImprovementManager")
 
+# Legacy JSON array history files above this size are stream-parsed when ijson is available
+STREAMING_LOAD_THRESHOLD = 10 * 1024 * 1024
+
+# Number of appended records after which the history file is rewritten
+HISTORY_COMPACTION_INTERVAL = 1000
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def _encode_records(records: List[Dict[str, Any]]) -> bytes:
+        """Encodes records as JSON Lines."""
+        return b"".join(orjson.dumps(record, option=_ORJSON_OPTIONS) for record in records)
+
+    _decode_json = orjson.loads
+else:
+    def _encode_records(records: List[Dict[str, Any]]) -> bytes:
+        """Encodes records as JSON Lines."""
+        return "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+
+    _decode_json = json.loads
+
+# Example metric scores used until experiments are scored by an evaluation model
+_DEFAULT_METRIC_SCORES = {
+    "response_quality": 0.85,
+    "context_usage": 0.78,
+    "knowledge_application": 0.92
+}
+_FALLBACK_METRIC_SCORE = 0.8
+
+# Example test query used to compare experimental parameters
+EXPERIMENT_TEST_QUERY = "Explain the concept of machine learning so that a beginner can understand it."
+
+
+class ImprovementRecord(TypedDict):
+    """Single entry of the improvement history."""
+    type: str
+    parameter: str
+    old_value: Any
+    new_value: Any
+    timestamp: float
+    experiment_id: Any
+    metrics_improvement: Dict[str, float]
+
+
 class SelfImprovementManager:
     """Class managing the system self-improvement process."""
 
@@ -24,16 +81,32 @@ class SelfImprovementManager:
                                             ["response_quality", "context_usage", "knowledge_application"])
         self.improvement_threshold = config.get("improvement_threshold", 0.7)
         self.max_experiment_iterations = config.get("max_experiment_iterations", 5)
-        self.history_file = config.get("history_file", "./data/metawareness/improvement_history.json")
+        self.history_file = config.get("history_file", "./data/metawareness/improvement_history.jsonl")
+        self.report_items_per_type = config.get("report_items_per_type", 20)
         
         # Create a directory for data if it doesn't exist
         os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
         
-        # List of conducted experiments
-        self.experiments = []
+        # Most recent experiments; the oldest are evicted once the limit is reached
+        self.experiments = deque(maxlen=config.get("max_stored_experiments", 1000))
+        self._last_experiment_id = 0
+        
+        # Successful experiments whose improvements have not been applied yet
+        self._pending_successful_experiments = deque()
+        self._pending_experiment_ids = set()
+        self._last_scanned_experiment = None
+        
+        # (experiment_id, parameter) pairs already applied in this session
+        self._applied_params = set()
         
         # List of implemented improvements
-        self.improvement_history = []
+        self.improvement_history: List[ImprovementRecord] = []
+        
+        # Tracks whether the history changed since it was last loaded or saved
+        self._history_dirty = False
+        self._saved_history_length = 0
+        self._history_needs_compaction = False
+        self._appended_since_compaction = 0
         
         # Load improvement history if it exists
         self.load_improvement_history()
@@ -56,6 +129,26 @@ class SelfImprovementManager:
         
         logger.info(f"Learning rate adjusted: {current_lr} -> {new_lr}")
 
+    def _next_experiment_id(self) -> int:
+        """Returns a new experiment id that stays unique after old experiments are evicted."""
+        self._last_experiment_id = max(self._last_experiment_id, len(self.experiments)) + 1
+        return self._last_experiment_id
+
+    def _experiments_since_last_scan(self) -> List[Dict[str, Any]]:
+        """Returns experiments added after the last scanned one, oldest first.
+        
+        Walks back from the newest experiment, so the cost depends only on the
+        number of new experiments. If the last scanned experiment has already
+        been evicted, all stored experiments are new.
+        """
+        new_experiments = []
+        for experiment in reversed(self.experiments):
+            if experiment is self._last_scanned_experiment:
+                break
+            new_experiments.append(experiment)
+        new_experiments.reverse()
+        return new_experiments
+
     def design_experiment(self, reflection: str) -> Dict[str, Any]:
         """Designs a self-improvement experiment based on reflection.
         
@@ -73,7 +166,7 @@ class SelfImprovementManager:
         # We analyze the reflection to find potential areas for improvement
         # In this example, we assume the reflection concerns overly general responses
         experiment = {
-            "id": len(self.experiments) + 1,
+            "id": self._next_experiment_id(),
             "hypothesis": "Reducing temperature improves response coherence",
             "parameters": {"temperature": 0.5},  # Parameter to adjust
             "metrics": self.improvement_metrics,  # Metrics to monitor
@@ -100,53 +193,116 @@ class SelfImprovementManager:
             Dictionary with experiment results
         """
         logger.info(f"Starting experiment: {experiment['hypothesis']}")
+        now = time.time()
         
-        # Save original parameters
-        original_params = {}
-        for param_name, param_value in experiment["parameters"].items():
-            if hasattr(model_manager.config, param_name):
-                original_params[param_name] = model_manager.config[param_name]
-        
-        # Apply experimental parameters
-        for param_name, param_value in experiment["parameters"].items():
-            if hasattr(model_manager.config, param_name):
-                model_manager.config[param_name] = param_value
+        model_config = model_manager.config
+        original_params = self._apply_experiment_params(experiment, model_config)
         
         # Conduct the experiment
         # In a real implementation, we would conduct a series of tests here
         # For simplification, we're generating example responses and evaluating them
         
-        # Example test query
-        test_query = "Explain the concept of machine learning so that a beginner can understand it."
+        # Generate response with new parameters. This runs synchronously on purpose:
+        # generate_response reads the shared model config that holds the experimental
+        # parameters, so they cannot be restored until generation has finished
+        try:
+            test_response = model_manager.generate_response(EXPERIMENT_TEST_QUERY, "")
+        finally:
+            # Restore original parameters, also when generation fails
+            for param_name, param_value in original_params.items():
+                model_config[param_name] = param_value
         
-        # Generate response with new parameters
-        test_response = model_manager.generate_response(test_query, "")
+        return self._record_experiment_results(experiment, original_params, test_response, now)
+
+    def run_experiments_batch(self, experiments: List[Dict[str, Any]], model_manager: Any,
+                              learning_manager: Any) -> List[Dict[str, Any]]:
+        """Conducts several experiments, batching test generation per parameter set.
         
-        # Response evaluation (would be more extensive in a real implementation)
-        metrics = {}
-        for metric in experiment["metrics"]:
-            # Example scores (in reality, they would be generated by an evaluation model)
-            if metric == "response_quality":
-                metrics[metric] = 0.85
-            elif metric == "context_usage":
-                metrics[metric] = 0.78
-            elif metric == "knowledge_application":
-                metrics[metric] = 0.92
-            else:
-                metrics[metric] = 0.8
+        Experiments sharing the same parameters are generated with a single
+        model_manager.generate_responses_batch call.
         
-        # Restore original parameters
-        for param_name, param_value in original_params.items():
-            model_manager.config[param_name] = param_value
+        Args:
+            experiments: List of experiment dictionaries
+            model_manager: ModelManager instance for testing
+            learning_manager: LearningManager instance for training
+            
+        Returns:
+            List of experiment results in the order of the experiments
+        """
+        logger.info(f"Starting batch of {len(experiments)} experiments")
+        now = time.time()
+        model_config = model_manager.config
+        
+        # Group experiments that can share one generation call
+        groups = {}
+        for experiment in experiments:
+            key = json.dumps(experiment["parameters"], sort_keys=True, default=str)
+            groups.setdefault(key, []).append(experiment)
+        
+        results_by_experiment = {}
+        for group in groups.values():
+            original_params = self._apply_experiment_params(group[0], model_config)
+            try:
+                test_responses = model_manager.generate_responses_batch(
+                    [EXPERIMENT_TEST_QUERY] * len(group),
+                    [[] for _ in group]
+                )
+            finally:
+                for param_name, param_value in original_params.items():
+                    model_config[param_name] = param_value
+            
+            for experiment, test_response in zip(group, test_responses):
+                results_by_experiment[id(experiment)] = self._record_experiment_results(
+                    experiment, original_params, test_response, now)
+        
+        return [results_by_experiment[id(experiment)] for experiment in experiments]
+
+    def _apply_experiment_params(self, experiment: Dict[str, Any], model_config: Dict[str, Any]) -> Dict[str, Any]:
+        """Applies experimental parameters to the model config.
+        
+        Args:
+            experiment: Dictionary describing the experiment
+            model_config: Model configuration to modify
+            
+        Returns:
+            Original values of the changed parameters
+        """
+        valid_keys = frozenset(model_config)
+        
+        original_params = {}
+        for param_name, param_value in experiment["parameters"].items():
+            if param_name in valid_keys:
+                original_params[param_name] = model_config[param_name]
+                model_config[param_name] = param_value
+        
+        return original_params
+
+    def _record_experiment_results(self, experiment: Dict[str, Any], original_params: Dict[str, Any],
+                                   test_response: str, run_at: float) -> Dict[str, Any]:
+        """Scores the test response and stores the results in the experiment.
+        
+        Args:
+            experiment: Dictionary describing the experiment
+            original_params: Parameter values before the experiment
+            test_response: Response generated with the experimental parameters
+            run_at: Time the experiment was started
+            
+        Returns:
+            Dictionary with experiment results
+        """
+        # Response evaluation (would be more extensive in a real implementation)
+        # Example scores (in reality, they would be generated by an evaluation model)
+        metrics = {metric: _DEFAULT_METRIC_SCORES.get(metric, _FALLBACK_METRIC_SCORE)
+                   for metric in experiment["metrics"]}
         
         # Experiment results
         results = {
             "metrics": metrics,
             "original_params": original_params,
             "experiment_params": experiment["parameters"],
-            "test_query": test_query,
+            "test_query": EXPERIMENT_TEST_QUERY,
             "test_response": test_response,
-            "run_at": time.time()
+            "run_at": run_at
         }
         
         # Update the experiment
@@ -166,6 +322,7 @@ class SelfImprovementManager:
             Dictionary with results evaluation
         """
         logger.info(f"Evaluating experiment results: {experiment['id']}")
+        now = time.time()
         
         # Check if the experiment has results
         if "results" not in experiment or experiment["status"] != "completed":
@@ -174,123 +331,240 @@ class SelfImprovementManager:
         # Get metrics
         metrics = experiment["results"]["metrics"]
         
-        # Check if metrics exceed the threshold
+        # Check if metrics exceed the threshold, tracking the weakest metric in the same pass
+        threshold = self.improvement_threshold
         improvements = {}
-        avg_improvement = 0.0
-        metrics_count = 0
+        total_improvement = 0.0
+        min_value = float("inf")
         
         for metric, value in metrics.items():
-            improvements[metric] = value - self.improvement_threshold
-            avg_improvement += improvements[metric]
-            metrics_count += 1
+            improvement = value - threshold
+            improvements[metric] = improvement
+            total_improvement += improvement
+            if value < min_value:
+                min_value = value
         
-        if metrics_count > 0:
-            avg_improvement /= metrics_count
+        avg_improvement = total_improvement / len(metrics) if metrics else 0.0
         
         # Consider the experiment successful if average improvement is positive
-        success = avg_improvement > 0 and all(value >= self.improvement_threshold for value in metrics.values())
+        # and no metric falls below the threshold
+        success = avg_improvement > 0 and min_value >= threshold
+        
+        return self._store_evaluation(experiment, success, improvements, avg_improvement, now)
+
+    def evaluate_experiments_batch(self, experiments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Evaluates results of several experiments in one vectorized pass.
         
+        Metric values of all experiments are laid out in a single array and
+        reduced per experiment, giving the same evaluations as calling
+        evaluate_experiment_results for each experiment.
+        
+        Args:
+            experiments: List of experiment dictionaries with results
+            
+        Returns:
+            List of evaluations in the order of the experiments
+        """
+        logger.info(f"Evaluating results of {len(experiments)} experiments")
+        now = time.time()
+        threshold = self.improvement_threshold
+        
+        evaluations = [None] * len(experiments)
+        scored = []
+        for i, experiment in enumerate(experiments):
+            if "results" not in experiment or experiment["status"] != "completed":
+                evaluations[i] = {"success": False, "improvements": {}, "average_improvement": 0.0}
+            elif not experiment["results"]["metrics"]:
+                evaluations[i] = self._store_evaluation(experiment, False, {}, 0.0, now)
+            else:
+                scored.append(i)
+        
+        if scored:
+            metric_items = [list(experiments[i]["results"]["metrics"].items()) for i in scored]
+            counts = np.fromiter((len(items) for items in metric_items), dtype=np.int64, count=len(scored))
+            values = np.fromiter((value for items in metric_items for _, value in items),
+                                 dtype=np.float64, count=int(counts.sum()))
+            offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            
+            improvements_arr = values - threshold
+            averages = np.add.reduceat(improvements_arr, offsets) / counts
+            successes = (averages > 0) & (np.minimum.reduceat(values, offsets) >= threshold)
+            improvement_values = improvements_arr.tolist()
+            
+            for n, i in enumerate(scored):
+                start = int(offsets[n])
+                improvements = {metric: improvement_values[start + k]
+                                for k, (metric, _) in enumerate(metric_items[n])}
+                evaluations[i] = self._store_evaluation(
+                    experiments[i], bool(successes[n]), improvements, float(averages[n]), now)
+        
+        return evaluations
+
+    def _store_evaluation(self, experiment: Dict[str, Any], success: bool, improvements: Dict[str, float],
+                          avg_improvement: float, evaluated_at: float) -> Dict[str, Any]:
+        """Saves an evaluation in the experiment and queues it if successful.
+        
+        Args:
+            experiment: Evaluated experiment dictionary
+            success: Whether the experiment was successful
+            improvements: Improvement over the threshold for each metric
+            avg_improvement: Average improvement over the threshold
+            evaluated_at: Evaluation time
+            
+        Returns:
+            Dictionary with results evaluation
+        """
         evaluation = {
             "success": success,
             "improvements": improvements,
             "average_improvement": avg_improvement,
-            "evaluated_at": time.time()
+            "evaluated_at": evaluated_at
         }
         
         # Save the evaluation in the experiment
         experiment["evaluation"] = evaluation
         
+        # Queue successful experiments for the next improvement application
+        if success:
+            self._queue_successful_experiment(experiment)
+        
         logger.info(f"Experiment evaluation: {success=}, {avg_improvement=}")
         return evaluation
 
-    def apply_successful_improvements(self, model_manager: Any) -> bool:
+    def _queue_successful_experiment(self, experiment: Dict[str, Any]) -> None:
+        """Queues a successful experiment for the next improvement application.
+        
+        Args:
+            experiment: Evaluated experiment dictionary
+        """
+        if experiment.get("applied") or id(experiment) in self._pending_experiment_ids:
+            return
+        self._pending_experiment_ids.add(id(experiment))
+        self._pending_successful_experiments.append(experiment)
+
+    def apply_successful_improvements(self, model_manager: Any, flush: bool = True) -> bool:
         """Applies successful improvements to the model.
         
+        Callers applying improvements in a batch can pass ``flush=False`` on each
+        call and persist the history once afterwards with ``flush()``.
+        
         Args:
             model_manager: ModelManager instance to update
+            flush: Whether to save the improvement history after applying
             
         Returns:
             True if improvements were applied, False otherwise
         """
         try:
             logger.info("Applying successful improvements to the model")
+            now = time.time()
+            log_info = logger.isEnabledFor(logging.INFO)
             
             if not self.experiments:
                 logger.debug("No experiments available for improvement application")
                 return False
             
+            model_config = getattr(model_manager, 'config', None)
+            if model_config is None:
+                logger.error("Model manager has no config attribute")
+                return False
+            valid_keys = frozenset(model_config)
+            
+            pending = self._pending_successful_experiments
+            
+            # Pick up experiments added since the last call that were evaluated elsewhere
+            for experiment in self._experiments_since_last_scan():
+                evaluation = experiment.get("evaluation")
+                if evaluation and evaluation.get("success", False):
+                    self._queue_successful_experiment(experiment)
+            self._last_scanned_experiment = self.experiments[-1]
+            
+            if not pending:
+                logger.debug("No successful experiments pending improvement application")
+                return False
+            
             applied = False
             failed_applications = []
+            applied_params = self._applied_params
             
-            # Review experiments and apply successful ones
-            for experiment in self.experiments:
+            # Apply pending successful experiments
+            while pending:
+                experiment = pending.popleft()
+                self._pending_experiment_ids.discard(id(experiment))
+                experiment["applied"] = True
                 try:
-                    if "evaluation" not in experiment:
-                        logger.debug(f"Experiment {experiment.get('id', 'unknown')} has no evaluation")
-                        continue
-                        
-                    if not experiment["evaluation"].get("success", False):
-                        logger.debug(f"Experiment {experiment.get('id', 'unknown')} was not successful")
-                        continue
-                    
                     experiment_id = experiment.get("id", "unknown")
-                    parameters = experiment.get("parameters", {})
+                    parameters = experiment.get("parameters")
                     
                     if not parameters:
-                        logger.warning(f"Experiment {experiment_id} has no parameters to apply")
+                        logger.warning("Experiment %s has no parameters to apply", experiment_id)
                         continue
                     
+                    improvements_delta = experiment["evaluation"].get("improvements", {})
+                    
                     # Apply parameter changes
                     for param_name, param_value in parameters.items():
                         try:
-                            if not hasattr(model_manager, 'config') or model_manager.config is None:
-                                logger.error("Model manager has no config attribute")
-                                failed_applications.append(f"{experiment_id}:{param_name}")
+                            if param_name not in valid_keys:
+                                logger.warning("Parameter %s not found in model config", param_name)
+                                continue
+                            
+                            key = (experiment_id, param_name)
+                            if key in applied_params:
                                 continue
-                                
-                            if param_name not in model_manager.config:
-                                logger.warning(f"Parameter {param_name} not found in model config")
+                            
+                            old_value = model_config[param_name]
+                            if old_value == param_value:
+                                # Nothing changes, so don't record a duplicate improvement
                                 continue
                             
-                            old_value = model_manager.config[param_name]
-                            model_manager.config[param_name] = param_value
+                            model_config[param_name] = param_value
                             
                             # Save information about the change
-                            improvement = {
+                            improvement: ImprovementRecord = {
                                 "type": "parameter_change",
                                 "parameter": param_name,
                                 "old_value": old_value,
                                 "new_value": param_value,
-                                "timestamp": time.time(),
+                                "timestamp": now,
                                 "experiment_id": experiment_id,
-                                "metrics_improvement": experiment["evaluation"].get("improvements", {})
+                                "metrics_improvement": improvements_delta
                             }
                             
                             self.improvement_history.append(improvement)
+                            applied_params.add(key)
+                            self._history_dirty = True
                             applied = True
                             
-                            logger.info(f"Improvement applied: {param_name} = {param_value} (from {old_value})")
+                            if log_info:
+                                logger.info("Improvement applied: %s = %s (from %s)", param_name, param_value, old_value)
                             
                         except Exception as e:
-                            logger.error(f"Error applying parameter {param_name} from experiment {experiment_id}: {e}")
+                            logger.error("Error applying parameter %s from experiment %s: %s", param_name, experiment_id, e)
                             failed_applications.append(f"{experiment_id}:{param_name}")
                             continue
                             
                 except Exception as e:
-                    logger.error(f"Error processing experiment {experiment.get('id', 'unknown')}: {e}")
+                    logger.error("Error processing experiment %s: %s", experiment.get('id', 'unknown'), e)
                     continue
             
+            # Cached responses were generated with the previous parameters
+            if applied and hasattr(model_manager, 'clear_response_cache'):
+                model_manager.clear_response_cache()
+            
             if failed_applications:
                 logger.warning(f"Failed to apply {len(failed_applications)} improvements: {failed_applications}")
             
             # Save improvement history
-            if applied:
+            if applied and flush:
                 try:
                     self.save_improvement_history()
                 except Exception as e:
                     logger.error(f"Error saving improvement history: {e}")
             
-            logger.info(f"Applied {len([h for h in self.improvement_history if h.get('timestamp', 0) > time.time() - 60])} improvements")
+            if log_info:
+                recent = sum(1 for h in self.improvement_history if h.get('timestamp', 0) > now - 60)
+                logger.info("Applied %d improvements", recent)
             return applied
             
         except Exception as e:
@@ -298,26 +572,44 @@ class SelfImprovementManager:
             logger.debug("Improvement application error details", exc_info=True)
             return False
 
+    def flush(self) -> None:
+        """Persists improvement history deferred by ``apply_successful_improvements(flush=False)``."""
+        self.save_improvement_history()
+
+    def _mark_history_clean(self) -> None:
+        """Marks the in-memory improvement history as in sync with the file."""
+        self._history_dirty = False
+        self._saved_history_length = len(self.improvement_history)
+
     def save_improvement_history(self) -> None:
-        """Saves improvement history to a file."""
+        """Saves improvement history to a file.
+        
+        The history is stored as JSON Lines. Records added since the last save
+        are appended; the whole file is only rewritten when it needs compaction.
+        Nothing is written when the history has not changed since it was last
+        loaded or saved.
+        """
+        if not self._history_dirty and len(self.improvement_history) == self._saved_history_length:
+            logger.debug("Improvement history unchanged, skipping save")
+            return
+        
         try:
             logger.info(f"Saving improvement history to: {self.history_file}")
             
             # Ensure directory exists
             os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
             
-            # Create backup of existing file
-            backup_file = f"{self.history_file}.backup"
-            if os.path.exists(self.history_file):
-                try:
-                    import shutil
-                    shutil.copy2(self.history_file, backup_file)
-                except Exception as e:
-                    logger.warning(f"Could not create backup file: {e}")
+            new_records = self.improvement_history[self._saved_history_length:]
             
-            # Save improvement history
-            with open(self.history_file, 'w') as f:
-                json.dump(self.improvement_history, f, indent=2)
+            # Appending is only valid if the history grew without changing earlier records
+            if (self._history_needs_compaction
+                    or not new_records
+                    or not os.path.exists(self.history_file)
+                    or self._appended_since_compaction + len(new_records) >= HISTORY_COMPACTION_INTERVAL):
+                self.compact_history()
+            else:
+                self._append_improvements(new_records)
+                self._mark_history_clean()
                 
             logger.debug(f"Successfully saved {len(self.improvement_history)} improvement records")
             
@@ -329,10 +621,124 @@ class SelfImprovementManager:
             logger.error(f"Unexpected error saving improvement history: {e}")
             logger.debug("Save improvement history error details", exc_info=True)
 
+    def _append_improvements(self, records: List[ImprovementRecord]) -> None:
+        """Appends improvement records to the history file, one JSON object per line.
+        
+        Args:
+            records: Records to append
+        """
+        with open(self.history_file, 'ab') as f:
+            f.write(_encode_records(records))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        self._appended_since_compaction += len(records)
+
+    def compact_history(self) -> None:
+        """Rewrites the history file from the in-memory history.
+        
+        The file is written to a temporary file and atomically swapped in; the
+        previous version is kept as a backup. This also converts legacy JSON
+        array files to JSON Lines and drops partially written lines.
+        
+        Raises:
+            OSError: If the history file cannot be written
+        """
+        logger.info(f"Compacting improvement history file: {self.history_file}")
+        
+        # Write to a temporary file first so the history file is never half-written
+        tmp_file = f"{self.history_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(_encode_records(self.improvement_history))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        # Keep the previous version as a backup (rename, no copy) and swap in the new file
+        backup_file = f"{self.history_file}.backup"
+        if os.path.exists(self.history_file):
+            try:
+                os.replace(self.history_file, backup_file)
+            except OSError as e:
+                logger.warning(f"Could not create backup file: {e}")
+        os.replace(tmp_file, self.history_file)
+        
+        self._appended_since_compaction = 0
+        self._history_needs_compaction = False
+        self._mark_history_clean()
+
+    def _read_history_file(self, path: str) -> List[ImprovementRecord]:
+        """Reads improvement records from a JSON Lines or legacy JSON array file.
+        
+        Args:
+            path: File to read
+            
+        Returns:
+            List of improvement records
+            
+        Raises:
+            json.JSONDecodeError: If a legacy JSON array file is malformed
+            ValueError: If the file does not contain a list of records
+        """
+        with open(path, 'r') as f:
+            head = f.read(64).lstrip()
+            f.seek(0)
+            
+            if not head.startswith('['):
+                records = []
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(_decode_json(line))
+                    except json.JSONDecodeError:
+                        # Typically a partially written last line after a crash
+                        logger.warning(f"Skipping malformed improvement record at line {line_number}")
+                        self._history_needs_compaction = True
+                return records
+            
+            # Legacy JSON array - converted to JSON Lines on the next save
+            self._history_needs_compaction = True
+            if ijson is None or os.path.getsize(path) <= STREAMING_LOAD_THRESHOLD:
+                data = _decode_json(f.read())
+            else:
+                data = None
+        
+        if data is None:
+            # Parse records incrementally instead of holding raw text and parsed list at once
+            with open(path, 'rb') as f:
+                data = list(ijson.items(f, 'item', use_float=True))
+        
+        if not isinstance(data, list):
+            raise ValueError(f"Invalid improvement history format - expected list, got {type(data)}")
+        return data
+
     def load_improvement_history(self) -> None:
         """Loads improvement history from a file."""
+        backup_file = f"{self.history_file}.backup"
         try:
             if not os.path.exists(self.history_file):
+                # A compaction interrupted between the backup and final rename leaves only the backup
+                if os.path.exists(backup_file):
+                    logger.warning("Improvement history file missing, loading from backup file")
+                    self.improvement_history = self._read_history_file(backup_file)
+                    self._history_needs_compaction = True
+                    self._mark_history_clean()
+                    return
+                
+                # Before the JSON Lines format the default history file was the .json sibling
+                history_root, history_ext = os.path.splitext(self.history_file)
+                legacy_file = f"{history_root}.json"
+                if history_ext == ".jsonl" and os.path.exists(legacy_file):
+                    logger.info(f"Migrating improvement history from {legacy_file} to {self.history_file}")
+                    self.improvement_history = self._read_history_file(legacy_file)
+                    try:
+                        self.compact_history()
+                    except OSError as e:
+                        # The history stays marked for compaction and is rewritten on the next save
+                        logger.error(f"Could not write migrated improvement history: {e}")
+                        self._mark_history_clean()
+                    return
+                
                 logger.debug(f"Improvement history file does not exist: {self.history_file}")
                 self.improvement_history = []
                 return
@@ -346,33 +752,24 @@ class SelfImprovementManager:
                 return
             
             # Check file size
-            file_size = os.path.getsize(self.history_file)
-            if file_size == 0:
+            if os.path.getsize(self.history_file) == 0:
                 logger.warning("Improvement history file is empty")
                 self.improvement_history = []
                 return
             
-            with open(self.history_file, 'r') as f:
-                data = json.load(f)
-                
-            # Validate loaded data
-            if not isinstance(data, list):
-                logger.error(f"Invalid improvement history format - expected list, got {type(data)}")
-                self.improvement_history = []
-                return
-                
-            self.improvement_history = data
+            self.improvement_history = self._read_history_file(self.history_file)
+            self._mark_history_clean()
             logger.info(f"Successfully loaded {len(self.improvement_history)} improvement records")
             
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error loading improvement history: {e}")
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.error(f"Error decoding improvement history: {e}")
             # Try to load backup file
-            backup_file = f"{self.history_file}.backup"
             if os.path.exists(backup_file):
                 try:
                     logger.info("Attempting to load from backup file")
-                    with open(backup_file, 'r') as f:
-                        self.improvement_history = json.load(f)
+                    self.improvement_history = self._read_history_file(backup_file)
+                    self._history_needs_compaction = True
+                    self._mark_history_clean()
                     logger.info("Successfully loaded from backup file")
                 except Exception as backup_e:
                     logger.error(f"Error loading from backup file: {backup_e}")
@@ -402,32 +799,33 @@ class SelfImprovementManager:
             return "No improvements implemented."
         
         # Grouping improvements by type
-        improvements_by_type = {}
+        improvements_by_type = defaultdict(list)
         
         for improvement in self.improvement_history:
-            imp_type = improvement.get("type", "unknown")
-            if imp_type not in improvements_by_type:
-                improvements_by_type[imp_type] = []
-            
-            improvements_by_type[imp_type].append(improvement)
+            improvements_by_type[improvement.get("type", "unknown")].append(improvement)
         
         # Generating the report
-        report = "Self-improvement process report:\n\n"
+        parts = ["Self-improvement process report:\n\n"]
         
         for imp_type, improvements in improvements_by_type.items():
-            report += f"Improvement type: {imp_type}\n"
-            report += f"Number of improvements: {len(improvements)}\n"
+            parts.append(f"Improvement type: {imp_type}\n")
+            parts.append(f"Number of improvements: {len(improvements)}\n")
+            
+            # Only the most recent improvements of each type are listed
+            start = 0
+            if self.report_items_per_type and len(improvements) > self.report_items_per_type:
+                start = len(improvements) - self.report_items_per_type
+                parts.append(f"Showing the latest {self.report_items_per_type}\n")
             
-            for i, improvement in enumerate(improvements, 1):
-                report += f"\n{i}. Change: {improvement.get('parameter', 'unknown parameter')}\n"
-                report += f"   Old value: {improvement.get('old_value', 'N/A')}\n"
-                report += f"   New value: {improvement.get('new_value', 'N/A')}\n"
+            for i, improvement in enumerate(improvements[start:], start + 1):
+                parts.append(f"\n{i}. Change: {improvement.get('parameter', 'unknown parameter')}\n"
+                             f"   Old value: {improvement.get('old_value', 'N/A')}\n"
+                             f"   New value: {improvement.get('new_value', 'N/A')}\n")
                 
                 # Display metrics improvement
                 metrics_improvement = improvement.get("metrics_improvement", {})
                 if metrics_improvement:
-                    report += "   Metrics improvement:\n"
-                    for metric, value in metrics_improvement.items():
-                        report += f"   - {metric}: {value:.2f}\n"
+                    parts.append("   Metrics improvement:\n")
+                    parts.extend(f"   - {metric}: {value:.2f}\n" for metric, value in metrics_improvement.items())
         
-        return report
\ No newline at end of file
+        return "".join(parts)
\ No newline at end of file
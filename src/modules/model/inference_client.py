@@ -0,0 +1,59 @@
+"""Client for OpenAI-compatible inference servers (vLLM, TGI)."""
+
+from typing import Any, Dict, List
+
+import requests
+
+
+class InferenceServerClient:
+    """Thin HTTP client for the /v1/completions endpoint of an inference server.
+
+    vLLM (`vllm serve`) and TGI both expose this endpoint. Batching across
+    concurrent requests, the paged KV cache and prefix caching of the shared
+    system prompt all happen on the server.
+    """
+
+    def __init__(self, base_url: str, model: str, timeout: float = 120.0):
+        """Initialize the client.
+
+        Args:
+            base_url: Server address, e.g. http://localhost:8000
+            model: Model name as registered on the server
+            timeout: Request timeout in seconds
+        """
+        self.completions_url = f"{base_url.rstrip('/')}/v1/completions"
+        self.model = model
+        self.timeout = timeout
+        # Keep-alive connection pool shared by all requests
+        self.session = requests.Session()
+
+    def complete(self, prompt: str, params: Dict[str, Any]) -> str:
+        """Generate a completion for a single prompt.
+
+        Args:
+            prompt: Fully formatted prompt
+            params: Sampling parameters in OpenAI completions format
+
+        Returns:
+            Generated text (without the prompt)
+        """
+        return self.complete_batch([prompt], params)[0]
+
+    def complete_batch(self, prompts: List[str], params: Dict[str, Any]) -> List[str]:
+        """Generate completions for several prompts in one request.
+
+        Args:
+            prompts: Fully formatted prompts
+            params: Sampling parameters in OpenAI completions format
+
+        Returns:
+            Generated texts in the order of the prompts
+        """
+        payload = {"model": self.model, "prompt": prompts, **params}
+        response = self.session.post(self.completions_url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+        texts = [""] * len(prompts)
+        for choice in response.json()["choices"]:
+            texts[choice["index"]] = choice["text"]
+        return texts
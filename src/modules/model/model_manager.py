@@ -1,23 +1,41 @@
 """Language model management module."""
 
+import atexit
+import copy
 import logging
 import os
 import json
+import queue
 import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Iterator, List, Any, Optional, Union
 from dotenv import load_dotenv
-import re
 
 from src.config.config import MODEL_PROMPT
 from src.config import config
 
 # Import the consolidated cleanup function
-from src.utils.text_cleanup import cleanup_model_output
+from src.utils.text_cleanup import cleanup_model_output, count_special_chars
+from src.modules.model.inference_client import InferenceServerClient
 
-from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig, StaticCache, TextIteratorStreamer
 import torch
 
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables
 load_dotenv()
 
@@ -36,15 +54,350 @@ os.makedirs(log_dir, exist_ok=True)
 # Setup handler for main system log file as well
 main_log_file = os.path.join(log_dir, "skynet.log")
 
-# Add a file handler specifically for LLM interactions
-llm_handler = logging.FileHandler(os.path.join(log_dir, "llm_interactions.log"))
+# Add a file handler specifically for LLM interactions; files are opened on the first write
+llm_handler = logging.FileHandler(os.path.join(log_dir, "llm_interactions.log"), delay=True)
 llm_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-llm_logger.addHandler(llm_handler)
 
 # Add a handler to also log LLM interactions to the main system log
-main_handler = logging.FileHandler(main_log_file)
+main_handler = logging.FileHandler(main_log_file, delay=True)
 main_handler.setFormatter(logging.Formatter('%(asctime)s - LLM_INTERACTION - %(levelname)s - %(message)s'))
-llm_logger.addHandler(main_handler)
+
+
+class _MainLogDuplicateFilter(logging.Filter):
+    """Drop interaction records that already reach the main log through the root logger.
+    
+    Records are passed on to the root handlers, so when the application configured
+    a root file handler on the main log (src/main.py does) main_handler would write
+    every record a second time. The root handlers are checked per record because entry points
+    configure logging after importing this module.
+    """
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not any(
+            isinstance(handler, logging.FileHandler) and handler.baseFilename == main_handler.baseFilename
+            for handler in logging.getLogger().handlers
+        )
+
+
+main_handler.addFilter(_MainLogDuplicateFilter())
+
+
+def _dumps_log_record(record: Dict[str, Any]) -> str:
+    """Serialize an interaction log record as a single JSON line."""
+    if orjson is not None:
+        return orjson.dumps(record).decode()
+    return json.dumps(record)
+
+
+class _InteractionRecord:
+    """Interaction log message that is serialized to JSON when first formatted.
+    
+    Only the epoch time is taken when the record is created; the ISO timestamp
+    is formatted together with the JSON on the log listener thread.
+    """
+    
+    __slots__ = ("fields", "created", "_json")
+    
+    def __init__(self, fields: Dict[str, Any]):
+        self.fields = fields
+        self.created = time.time()
+        self._json = None
+    
+    def __str__(self) -> str:
+        # Every handler formatting the record reuses the same serialization
+        if self._json is None:
+            self._json = _dumps_log_record({
+                "timestamp": datetime.fromtimestamp(self.created).isoformat(),
+                **self.fields
+            })
+        return self._json
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread.
+    
+    Records never leave the process, so they are queued as they are instead of
+    being formatted and copied on the logging thread.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class _RootLoggerForwarder(logging.Handler):
+    """Pass interaction records to the handlers of the root logger.
+    
+    Stands in for propagation, which would run the root handlers (console and
+    log file set up by the entry points) on the generating thread. Like
+    propagation from a logger with its own handler, it never falls back to
+    logging.lastResort when the root logger has no handlers.
+    """
+    
+    def emit(self, record: logging.LogRecord) -> None:
+        root = logging.getLogger()
+        if not root.filter(record):
+            return
+        for handler in root.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+# The file handlers run on a background listener thread, so generation only enqueues
+# records; the JSON serialization happens there as well
+llm_log_queue = queue.Queue(-1)
+llm_log_listener = QueueListener(
+    llm_log_queue, llm_handler, main_handler, _RootLoggerForwarder(), respect_handler_level=True
+)
+llm_log_listener.start()
+atexit.register(llm_log_listener.stop)
+llm_logger.addHandler(_DeferredQueueHandler(llm_log_queue))
+llm_logger.propagate = False
+
+
+# Static head of every prompt: the system prompt does not change while the process runs
+PROMPT_HEADER = f"<|begin_of_text|>\n<|system|>\n{MODEL_PROMPT}"
+
+# Returned instead of a response when generation fails; never cached
+GENERATION_ERROR_RESPONSE = "I'm sorry, there was a technical problem generating the response."
+
+# Config parameters that affect generated text and therefore key the response cache
+RESPONSE_CACHE_PARAMS = (
+    "temperature", "do_sample", "max_new_tokens", "min_length", "repetition_penalty",
+    "no_repeat_ngram_size", "top_p", "top_k", "enable_sentence_completion"
+)
+
+# Patterns identifying corrupted output
+CORRUPTION_PATTERNS = [
+    # Nested code markers or tags
+    r'```[^`]*```',
+    r'`{3,}',
+    # HTML/XML style tags
+    r'</?[A-Za-z]+/?>',
+    # Nested parentheses with paths
+    r'/[A-Za-z/_.]+/',
+    # Multiple parentheses, braces, etc.
+    r'[\)\}\(\{\[\]]{3,}',
+    # Markers like (Lira:)
+    r'\([A-Za-z]+:?\)',
+    # Lines containing mainly invalid characters
+    r'\|+\s*\|+',
+    # Specific markers from damaged models
+    r'=====',
+    r'\(/+\)',
+    r'\(\*\)',
+    r'/LIRA/',
+    # Additional patterns detected in logs
+    r'```\n\n```',
+    r'\(\*\)\s*\(\*\)',
+    r'\(\s*\`\s*```\)',
+    r'\s*/\)\s*```',
+    r'}\s*}\s*}',
+    r'\*\*\*\.\*\*\*',
+    r'<[/]?lira[/]?>',
+    r'<[/]?assistant[/]?>',
+    r'\(\.\*\.\*\.\)',
+    r'[a-zA-Z]+[/][a-zA-Z]+[/][a-zA-Z]+',
+    r'\("`"\)',
+    r'\.{3,}',
+    r'\("```\)',
+    r'/usr/local/bin',
+    r'<\w+/>'
+]
+
+# All corruption patterns fused into one alternation, so a response is scanned once
+_CORRUPTION_RE = re.compile("|".join(f"(?:{pattern})" for pattern in CORRUPTION_PATTERNS))
+
+def _compile_hyperscan_database(patterns: List[str], extra_flags: int = 0):
+    r"""Compile patterns into a Hyperscan database when hyperscan is installed.
+    
+    Args:
+        patterns: Regular expressions to match; any \s must be outside character classes
+        extra_flags: Hyperscan flags added to every pattern (e.g. UCP, CASELESS)
+        
+    Returns:
+        Hyperscan block-mode database, or None to fall back to the re module
+    """
+    if hyperscan is None:
+        return None
+    
+    flags = hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_UTF8 | extra_flags
+    # Python's \s also matches the \x1c-\x1f separators, Hyperscan's does not
+    expressions = [pattern.replace(r'\s', r'[\s\x1c-\x1f]').encode() for pattern in patterns]
+    try:
+        database = hyperscan.Database()
+        database.compile(
+            expressions=expressions,
+            ids=list(range(len(patterns))),
+            elements=len(patterns),
+            flags=[flags] * len(patterns)
+        )
+        return database
+    except Exception as e:
+        logger.warning(f"Could not compile Hyperscan database, using re: {e}")
+        return None
+
+
+# UCP gives \w and \s the same Unicode meaning as Python's re module
+_CORRUPTION_DB = _compile_hyperscan_database(
+    CORRUPTION_PATTERNS, hyperscan.HS_FLAG_UCP if hyperscan is not None else 0
+)
+
+# Hyperscan scratch space must not be shared between concurrent scans
+_scan_state = threading.local()
+
+
+def _stop_scan(match_id, start, end, flags, context):
+    """Hyperscan match handler that ends the scan at the first match."""
+    return True
+
+
+def _hyperscan_matches(database, scratch_name: str, text: str) -> bool:
+    """Scan text with a Hyperscan database, stopping at the first match.
+    
+    Args:
+        database: Compiled Hyperscan database
+        scratch_name: Attribute of _scan_state holding this thread's scratch for the database
+        text: Text to scan
+        
+    Returns:
+        True if at least one pattern matches
+    """
+    scratch = getattr(_scan_state, scratch_name, None)
+    if scratch is None:
+        scratch = hyperscan.Scratch(database)
+        setattr(_scan_state, scratch_name, scratch)
+    
+    try:
+        database.scan(text.encode("utf-8"), match_event_handler=_stop_scan, scratch=scratch)
+    except hyperscan.ScanTerminated:
+        return True
+    return False
+
+
+def _contains_corruption_pattern(text: str) -> bool:
+    """Check whether any of CORRUPTION_PATTERNS occurs in the text.
+    
+    Args:
+        text: Text to scan
+        
+    Returns:
+        True if at least one pattern matches
+    """
+    if _CORRUPTION_DB is None:
+        return _CORRUPTION_RE.search(text) is not None
+    return _hyperscan_matches(_CORRUPTION_DB, "corruption_scratch", text)
+
+# Patterns that indicate the model is impersonating Tata/Jarek
+IMPERSONATION_PATTERNS = [
+    r'\btata\s*:',           # "Tata:" or "tata:"
+    r'\bjarek\s*:',          # "Jarek:" or "jarek:"
+    r'\btato\s*:',           # "Tato:" - vocative form
+    r'<\|user\|>',           # User token
+    r'\buser\s*:',           # "User:"
+    r'\b[Tt]ata\s+mówi',     # "Tata mówi" or "tata mówi"
+    r'\b[Jj]arek\s+mówi',    # "Jarek mówi" or "jarek mówi"
+    r'\b[Tt]ata\s+odpowiada', # "Tata odpowiada"
+    r'\b[Jj]arek\s+odpowiada' # "Jarek odpowiada"
+]
+
+_IMPERSONATION_RES = tuple(re.compile(pattern, re.IGNORECASE) for pattern in IMPERSONATION_PATTERNS)
+# Same patterns as one alternation: whether a text contains any of them in a single scan
+_IMPERSONATION_RE = re.compile("|".join(f"(?:{pattern})" for pattern in IMPERSONATION_PATTERNS), re.IGNORECASE)
+# Hyperscan has no Unicode \b (UCP), so this database is only used for ASCII text,
+# where ASCII and Unicode word boundaries agree
+_IMPERSONATION_DB = _compile_hyperscan_database(
+    IMPERSONATION_PATTERNS, hyperscan.HS_FLAG_CASELESS if hyperscan is not None else 0
+)
+
+
+def _contains_impersonation_pattern(text: str) -> bool:
+    """Check whether any of IMPERSONATION_PATTERNS occurs in the text (case-insensitive).
+    
+    Args:
+        text: Text to scan
+        
+    Returns:
+        True if at least one pattern matches
+    """
+    # Non-ASCII text needs Unicode word boundaries and case folding (re also
+    # folds e.g. the Kelvin sign onto "k"), which only re provides
+    if _IMPERSONATION_DB is None or not text.isascii():
+        return _IMPERSONATION_RE.search(text) is not None
+    return _hyperscan_matches(_IMPERSONATION_DB, "impersonation_scratch", text)
+
+
+def _segment_after(text: str, marker: str) -> Optional[str]:
+    """Return the text between the first and second occurrence of a marker.
+    
+    Same result as text.split(marker)[1], without splitting the whole text.
+    
+    Args:
+        text: Text to search
+        marker: Marker string
+        
+    Returns:
+        Text after the first marker up to the next one, or None if the marker is absent
+    """
+    _, found, rest = text.partition(marker)
+    if not found:
+        return None
+    return rest.partition(marker)[0]
+
+
+def _is_persona_context(item: Any) -> bool:
+    """Check whether a context item is the persona description added by PersonaManager.
+    
+    Args:
+        item: First item of the prompt context
+        
+    Returns:
+        True if the item is a persona context
+    """
+    return isinstance(item, str) and item.strip().startswith(("You are ", "Jesteś "))
+
+# Maximum number of persona prompt heads whose token ids are kept
+PERSONA_PREFIX_CACHE_SIZE = 8
+
+# Attention backend tried next when the model rejects an automatically selected one
+ATTN_IMPLEMENTATION_FALLBACKS = {"flash_attention_2": "sdpa", "sdpa": "eager"}
+# Load errors that reject the attention backend rather than the model or its config
+_ATTN_BACKEND_ERROR_RE = re.compile(r'attn_implementation|flash\s*attention|sdpa|scaled_dot_product', re.IGNORECASE)
+
+# Names accepted by the `torch_dtype` config key
+TORCH_DTYPES = {
+    "bfloat16": torch.bfloat16,
+    "float16": torch.float16,
+    "float32": torch.float32
+}
+
+# Prompt lengths are padded up to one of these sizes when the model is compiled,
+# so that the compiled forward pass sees a small fixed set of input shapes
+PROMPT_LENGTH_BUCKETS = (64, 128, 256, 512, 1024, 2048)
+
+# generate() parameters that only apply when do_sample is set
+SAMPLING_PARAMS = ("temperature", "top_p", "top_k")
+
+# Characters that end a sentence for sentence completion
+SENTENCE_ENDINGS = ('.', '!', '?', ':', ';')
+
+
+def _default_4bit_compute_dtype() -> torch.dtype:
+    """Compute dtype for bitsandbytes 4-bit layers when `torch_dtype` is not configured.
+    
+    bfloat16 has float32's exponent range and fast kernels on Ampere or newer GPUs
+    and on CPUs with AVX512-BF16; elsewhere float16 is used.
+    
+    Returns:
+        torch.bfloat16 or torch.float16
+    """
+    if torch.cuda.is_available():
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    try:
+        if torch.ops.mkldnn._is_mkldnn_bf16_supported():
+            return torch.bfloat16
+    except (AttributeError, RuntimeError):
+        pass
+    return torch.float16
 
 
 class ModelManager:
@@ -59,16 +412,74 @@ class ModelManager:
         self.config = config
         logger.info(f"Initializing language model {config['base_model']}...")
         
+        # Name of the loaded model reported in the interaction log; the weights stay
+        # loaded even if the config value is changed later
+        self._model_name = config.get('base_model', 'unknown')
+        
+        # Bounded LRU cache of responses for near-deterministic generation settings
+        self._response_cache = OrderedDict()
+        self._response_cache_size = config.get('response_cache_size', 256)
+        
+        # (base_model, extractor) pair resolved by _response_extractor
+        self._extractor_cache = None
+        
+        # Models that do not produce corrupted output can skip the pattern scan of every response
+        self._check_output_corruption = config.get('check_output_corruption', True)
+        
+        # Request queue of the micro-batching worker, see _init_request_batcher
+        self._batch_queue = None
+        
+        # Compute dtype for CUDA autocast during generation, see _autocast
+        self._autocast_dtype = None
+        
+        # Generation can be delegated to an inference server (vLLM, TGI), which batches
+        # concurrent requests and caches the shared prompt prefix; no local weights are loaded
+        self._inference_client = None
+        if config.get('inference_server_url'):
+            self._inference_client = InferenceServerClient(
+                config['inference_server_url'],
+                config.get('inference_server_model', config['base_model']),
+                timeout=config.get('inference_server_timeout', 120)
+            )
+            self.model = None
+            self.tokenizer = None
+            self.assistant_model = None
+            self._model_compiled = False
+            logger.info(f"Using inference server at {config['inference_server_url']} for generation")
+            return
+        
+        # Optional explicit dtype for weights (non-quantized) or 4-bit compute
+        dtype_name = config.get('torch_dtype')
+        if dtype_name is not None and dtype_name not in TORCH_DTYPES:
+            raise ValueError(f"Unsupported torch_dtype {dtype_name!r}, expected one of {list(TORCH_DTYPES)}")
+        
         # Apply quantization if configured
         quantization_config = None
         if 'quantization' in config and config['quantization'] == '4bit':
             logger.info("Applying 4-bit quantization for efficient operation on available hardware")
             quantization_config = BitsAndBytesConfig(
                 load_in_4bit=True,
-                bnb_4bit_compute_dtype=torch.float16,
+                bnb_4bit_compute_dtype=TORCH_DTYPES[dtype_name] if dtype_name else _default_4bit_compute_dtype(),
                 bnb_4bit_quant_type="nf4",
                 bnb_4bit_use_double_quant=True
             )
+            # Some layers upcast activations to float32 (e.g. norms); autocast keeps the
+            # matmuls that follow in the 4-bit compute dtype
+            if torch.cuda.is_available():
+                self._autocast_dtype = quantization_config.bnb_4bit_compute_dtype
+        elif config.get('quantization') in ('gptq', 'awq'):
+            # Pre-quantized checkpoints carry their own quantization config and load
+            # with fused int4 dequantize-matmul kernels
+            logger.info(f"Loading pre-quantized {config['quantization'].upper()} checkpoint")
+        elif config.get('quantization') == 'fp8':
+            logger.info("Applying FP8 weight quantization")
+            from transformers import FbgemmFp8Config
+            quantization_config = FbgemmFp8Config()
+        elif config.get('quantization') == 'hqq':
+            # Quantized at load time, no calibration data or pre-quantized checkpoint needed
+            logger.info("Applying HQQ 4-bit weight quantization")
+            from transformers import HqqConfig
+            quantization_config = HqqConfig(nbits=4, group_size=64)
         
         # Load model and tokenizer
         try:
@@ -84,12 +495,38 @@ class ModelManager:
             
             # Parameters for model constructor
             model_kwargs = {
-                "device_map": "auto",
+                "device_map": self._select_device_map(),
             }
+            logger.info(f"Using device_map {model_kwargs['device_map']}")
             
             # Add quantization configuration to model parameters
             if quantization_config:
                 model_kwargs["quantization_config"] = quantization_config
+            if config.get('quantization') != '4bit' and torch.cuda.is_available():
+                # Half precision halves weight memory traffic compared to the float32 default;
+                # bfloat16 needs Ampere or newer, older GPUs fall back to float16.
+                # GPTQ/AWQ int4 kernels compute in float16
+                if dtype_name is None:
+                    if config.get('quantization') in ('gptq', 'awq'):
+                        dtype_name = "float16"
+                    elif config.get('quantization') == 'hqq':
+                        # The torchao int4 matmul used by HQQ needs bfloat16
+                        dtype_name = "bfloat16"
+                    else:
+                        dtype_name = "bfloat16" if torch.cuda.is_bf16_supported() else "float16"
+                model_kwargs["torch_dtype"] = TORCH_DTYPES[dtype_name]
+                logger.info(f"Loading model weights in {dtype_name}")
+            elif config.get('quantization') == '4bit':
+                # Embeddings, norms and the LM head stay unquantized; load them in the
+                # compute dtype instead of float32
+                model_kwargs["torch_dtype"] = quantization_config.bnb_4bit_compute_dtype
+                logger.info(f"Loading unquantized weights in {quantization_config.bnb_4bit_compute_dtype}")
+            
+            # Fused attention kernels instead of the eager attention path
+            model_kwargs["attn_implementation"] = self._select_attn_implementation(
+                model_kwargs.get("torch_dtype")
+            )
+            logger.info(f"Using {model_kwargs['attn_implementation']} attention")
             
             # Parameters for tokenizer
             tokenizer_kwargs = {}
@@ -121,168 +558,1260 @@ class ModelManager:
                     logger.info("Model weights loaded successfully")
                 else:
                     raise
+            except ValueError as e:
+                # Architectures without FlashAttention-2 or SDPA support reject them at
+                # load time; only an automatically selected backend is replaced, and any
+                # other error (quantization, dtype, ...) is raised without retrying
+                error = e
+                while True:
+                    fallback = ATTN_IMPLEMENTATION_FALLBACKS.get(model_kwargs["attn_implementation"])
+                    if (fallback is None or self.config.get('attn_implementation')
+                            or not _ATTN_BACKEND_ERROR_RE.search(str(error))):
+                        if error is e:
+                            raise
+                        raise error from e
+                    logger.warning(f"{model_kwargs['attn_implementation']} attention unavailable for this model "
+                                   f"({error}), using {fallback} attention")
+                    model_kwargs["attn_implementation"] = fallback
+                    try:
+                        self.model = AutoModelForCausalLM.from_pretrained(
+                            config['base_model'],
+                            **model_kwargs,
+                            **pretrained_kwargs
+                        )
+                        break
+                    except ValueError as retry_error:
+                        error = retry_error
+                logger.info("Model weights loaded successfully")
             
             logger.info(f"Loading tokenizer for {config['base_model']}...")
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                config['base_model'],
-                **tokenizer_kwargs
-            )
+            try:
+                # Prefer the Rust-backed fast tokenizer, prompt encoding runs on every request
+                self.tokenizer = AutoTokenizer.from_pretrained(
+                    config['base_model'],
+                    use_fast=True,
+                    **tokenizer_kwargs
+                )
+            except Exception as e:
+                logger.warning(f"Fast tokenizer unavailable ({e}), falling back to the slow tokenizer")
+                self.tokenizer = AutoTokenizer.from_pretrained(
+                    config['base_model'],
+                    use_fast=False,
+                    **tokenizer_kwargs
+                )
             logger.info("Tokenizer loaded successfully")
             
-            # Make sure the tokenizer has pad_token
-            if self.tokenizer.pad_token is None:
-                logger.warning("Tokenizer doesn't have a pad token, setting it to eos_token")
-                self.tokenizer.pad_token = self.tokenizer.eos_token
+            # Make sure the tokenizer has pad_token
+            if self.tokenizer.pad_token is None:
+                logger.warning("Tokenizer doesn't have a pad token, setting it to eos_token")
+                self.tokenizer.pad_token = self.tokenizer.eos_token
+            
+            if config.get('quantization') == 'hqq':
+                self._prepare_hqq_inference(model_kwargs.get("torch_dtype"))
+            
+            self._init_generation_defaults()
+            self._init_prompt_prefix_cache()
+            self._init_pinned_input_buffer()
+            self._compile_model()
+            self._init_prefix_kv_cache()
+            self._load_assistant_model(model_kwargs, pretrained_kwargs)
+            self._init_request_batcher()
+            
+            logger.info(f"🎉 Model {config['base_model']} loaded successfully! System ready to receive messages.")
+        except Exception as e:
+            logger.error(f"Error loading model: {e}")
+            # Try to send error notification if communication interface is available
+            try:
+                # This will be called from main.py which has access to communication
+                self._model_loading_error = str(e)
+            except:
+                pass
+            raise
+    
+    def _prepare_hqq_inference(self, torch_dtype: Optional[torch.dtype]) -> None:
+        """Switch HQQ-quantized layers to the fused torchao int4 matmul kernels.
+        
+        Without this step HQQ dequantizes the weights on every forward pass.
+        The kernels need bfloat16 weights; otherwise the default HQQ backend stays.
+        
+        Args:
+            torch_dtype: Dtype the model weights were loaded in, if set
+        """
+        if torch_dtype != torch.bfloat16:
+            logger.warning("HQQ int4 kernels need bfloat16 weights, using the default HQQ backend")
+            return
+        try:
+            from hqq.utils.patching import prepare_for_inference
+            prepare_for_inference(self.model, backend="torchao_int4")
+            logger.info("HQQ layers prepared for torchao int4 inference")
+        except Exception as e:
+            logger.warning(f"Could not enable HQQ int4 kernels, using the default HQQ backend: {e}")
+    
+    def _select_device_map(self) -> Union[str, Dict[str, int]]:
+        """Choose where the model weights are placed when loading.
+        
+        With a single GPU the weights are loaded straight onto it, which skips
+        the per-module size planning of "auto" (and its silent CPU offload).
+        The `device_map` config key overrides the choice.
+        
+        Returns:
+            device_map argument for from_pretrained
+        """
+        device_map = self.config.get('device_map')
+        if device_map is not None:
+            return device_map
+        if torch.cuda.is_available() and torch.cuda.device_count() == 1:
+            return {"": 0}
+        return "auto"
+    
+    def _select_attn_implementation(self, torch_dtype: Optional[torch.dtype]) -> str:
+        """Choose the attention backend passed to from_pretrained.
+        
+        FlashAttention-2 needs the flash_attn package, an Ampere or newer GPU and
+        half-precision weights; otherwise PyTorch's fused SDPA kernels are used.
+        An explicit `attn_implementation` in the config always wins.
+        
+        Args:
+            torch_dtype: Dtype the model weights are loaded in, if set
+            
+        Returns:
+            Name of the attention implementation
+        """
+        if self.config.get('attn_implementation'):
+            return self.config['attn_implementation']
+        
+        if (torch.cuda.is_available() and torch_dtype in (torch.float16, torch.bfloat16)
+                and torch.cuda.get_device_capability()[0] >= 8):
+            try:
+                import flash_attn  # noqa: F401
+                return "flash_attention_2"
+            except ImportError:
+                pass
+        
+        return "sdpa"
+    
+    def _init_generation_defaults(self) -> None:
+        """Resolve generation settings that do not change after loading."""
+        self._device_model = None
+        self._cached_device = None
+        # (stop sequences, token ids) of the last converted config 'stop' value
+        self._stop_ids_cache = None
+        
+        # Context window of the model, used to keep prompt + new tokens within it
+        context_length = getattr(getattr(self.model, "config", None), "max_position_embeddings", None)
+        self._model_context_length = context_length if isinstance(context_length, int) else None
+        # Settings fixed for the lifetime of the model; a single returned sequence is
+        # generate()'s default and needs no argument
+        self._gen_kwargs_template = {
+            "pad_token_id": self.tokenizer.eos_token_id,
+            "eos_token_id": self.tokenizer.eos_token_id,
+            # Single-sequence decoding reusing the KV cache between steps
+            "num_beams": 1,
+            "use_cache": True
+        }
+        self._sentence_end_token_ids = self._find_sentence_end_token_ids()
+        
+        # Every prompt starts with the <|begin_of_text|> header. Tokenizers whose BOS
+        # token it is (Llama 3) must not add a second BOS token when encoding prompts
+        bos_token = getattr(self.tokenizer, "bos_token", None)
+        self._add_special_tokens = not (isinstance(bos_token, str) and bos_token
+                                        and PROMPT_HEADER.startswith(bos_token))
+    
+    def _find_sentence_end_token_ids(self) -> List[int]:
+        """Find the tokens that consist of a sentence ending, optionally followed by newlines.
+        
+        Returns:
+            Token ids whose text is a single SENTENCE_ENDINGS character and newlines
+        """
+        token_ids = set()
+        try:
+            for ending in SENTENCE_ENDINGS:
+                for text in (ending, ending + "\n", ending + "\n\n"):
+                    ids = self.tokenizer.encode(text, add_special_tokens=False)
+                    if len(ids) == 1 and self.tokenizer.decode(ids) == text:
+                        token_ids.add(int(ids[0]))
+        except Exception as e:
+            logger.debug(f"Could not determine sentence ending tokens: {e}")
+            return []
+        return sorted(token_ids)
+    
+    def _autocast(self):
+        """Autocast context for generation, a no-op unless _autocast_dtype is set.
+        
+        Returns:
+            torch.autocast context manager for CUDA
+        """
+        return torch.autocast(
+            device_type="cuda", dtype=self._autocast_dtype or torch.float16,
+            enabled=self._autocast_dtype is not None
+        )
+    
+    @property
+    def _device(self):
+        """Device of the current model, looked up again only if the model object is replaced."""
+        if self.model is not self._device_model:
+            self._device_model = self.model
+            self._cached_device = self.model.device
+        return self._cached_device
+    
+    def _load_assistant_model(self, model_kwargs: Dict[str, Any], pretrained_kwargs: Dict[str, Any]) -> None:
+        """Load the optional draft model used for speculative (assisted) decoding.
+        
+        The draft model is configured with `assistant_model` and must share the
+        tokenizer of the base model. A loading failure only disables assisted decoding.
+        
+        Args:
+            model_kwargs: Constructor parameters used for the base model
+            pretrained_kwargs: from_pretrained-only parameters used for the base model
+        """
+        self.assistant_model = None
+        assistant_name = self.config.get('assistant_model')
+        if not assistant_name:
+            return
+        
+        try:
+            logger.info(f"Loading assistant model {assistant_name} for speculative decoding...")
+            self.assistant_model = AutoModelForCausalLM.from_pretrained(
+                assistant_name,
+                **model_kwargs,
+                **pretrained_kwargs
+            )
+            logger.info("Assistant model loaded successfully")
+        except Exception as e:
+            logger.warning(f"Assistant model disabled: {e}")
+    
+    def _compile_model(self) -> None:
+        """Compile the model forward pass with torch.compile when enabled.
+        
+        Only the forward method is compiled, because generate() calls it on the
+        original module. Compilation is opt-in via the `compile_model` config key
+        and requires CUDA; any failure leaves the eager model in place. Compiled
+        graphs are cached on disk in `compile_cache_dir` across restarts, and warm-up
+        generations (`compile_warmup`, on by default) compile every prompt bucket at startup.
+        """
+        self._model_compiled = False
+        self._static_cache = None
+        if not (self.config.get('compile_model', False) and torch.cuda.is_available()):
+            return
+        if not hasattr(torch, 'compile'):
+            logger.warning("torch.compile is not available in this PyTorch version")
+            return
+        
+        try:
+            # Persist compiled graphs so a restart reuses them instead of recompiling
+            cache_dir = self.config.get('compile_cache_dir', './data/torch_compile_cache')
+            os.makedirs(cache_dir, exist_ok=True)
+            os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.abspath(cache_dir))
+            import torch._inductor.config as inductor_config
+            inductor_config.fx_graph_cache = True
+            
+            self.model.forward = torch.compile(
+                self.model.forward, mode='reduce-overhead', dynamic=True
+            )
+            self._model_compiled = True
+            logger.info("Model forward pass compiled with torch.compile")
+        except Exception as e:
+            logger.warning(f"torch.compile disabled: {e}")
+            return
+        
+        self._init_static_cache()
+        if self.config.get('compile_warmup', True):
+            self._warm_up_compiled_model()
+    
+    def _warm_up_compiled_model(self) -> None:
+        """Run short generations so compilation happens at startup, not on the first request.
+        
+        reduce-overhead mode records a CUDA graph per input shape, so a prompt
+        padded to every PROMPT_LENGTH_BUCKETS length that fits in the static
+        cache is generated once; the decode steps share the static cache shapes.
+        A failure here means the compiled graph does not work for this model,
+        so the eager forward pass is restored.
+        """
+        logger.info("Warming up the compiled model...")
+        try:
+            ids = self._prompt_token_ids(self._prepare_prompt("Hello", None))
+            buckets = [size for size in PROMPT_LENGTH_BUCKETS
+                       if size >= len(ids) and self._bucket_fits_context(size)]
+            if self._static_cache is not None:
+                buckets = [size for size in buckets if size + 2 <= self._static_cache_len]
+            
+            for bucket in buckets or [len(ids)]:
+                input_ids, attention_mask = self._left_pad_inputs(ids, bucket)
+                gen_kwargs = {**self._build_gen_kwargs(bucket), "max_new_tokens": 2}
+                # Warm up with the persistent cache, so its shapes are the compiled ones
+                cache_kwargs = self._static_cache_kwargs(bucket, gen_kwargs)
+                try:
+                    with torch.inference_mode(), self._autocast():
+                        self.model.generate(input_ids, attention_mask=attention_mask, **{**gen_kwargs, **cache_kwargs})
+                finally:
+                    self._release_static_cache(cache_kwargs)
+            logger.info(f"Compiled model warm-up finished for prompt lengths {buckets or [len(ids)]}")
+        except Exception as e:
+            logger.warning(f"Compiled model warm-up failed, using the eager model: {e}")
+            # The compiled wrapper was assigned as an instance attribute over the class method
+            del self.model.forward
+            self._model_compiled = False
+            self._static_cache = None
+    
+    def _bucket_fits_context(self, bucket: int) -> bool:
+        """Check whether a padded prompt of this length leaves room for max_new_tokens.
+        
+        Args:
+            bucket: Padded prompt length
+            
+        Returns:
+            True if the model context (when known) holds the bucket plus max_new_tokens
+        """
+        return (self._model_context_length is None
+                or bucket + self.config.get('max_new_tokens', 150) <= self._model_context_length)
+    
+    def _bucket_length(self, length: int) -> int:
+        """Select the padded length for a prompt of a compiled model.
+        
+        Args:
+            length: Prompt length in tokens
+            
+        Returns:
+            The next PROMPT_LENGTH_BUCKETS length, or `length` itself when the prompt
+            is longer than the largest bucket or padding would take context space
+            the new tokens need
+        """
+        bucket = next((size for size in PROMPT_LENGTH_BUCKETS if size >= length), length)
+        return bucket if self._bucket_fits_context(bucket) else length
+    
+    def _pad_to_bucket(self, input_ids, attention_mask):
+        """Left-pad prompts to the length selected by _bucket_length.
+        
+        Args:
+            input_ids: Encoded prompts of shape (batch, length)
+            attention_mask: Attention mask matching input_ids
+            
+        Returns:
+            Tuple of (input_ids, attention_mask) padded to the bucket length, or
+            unchanged when no bucket applies
+        """
+        length = input_ids.shape[1]
+        bucket = self._bucket_length(length)
+        if bucket == length:
+            return input_ids, attention_mask
+        
+        pad_length = bucket - length
+        padding = input_ids.new_full((input_ids.shape[0], pad_length), self.tokenizer.pad_token_id)
+        mask_padding = attention_mask.new_zeros((attention_mask.shape[0], pad_length))
+        return (
+            torch.cat([padding, input_ids], dim=1),
+            torch.cat([mask_padding, attention_mask], dim=1)
+        )
+    
+    def generate_response(self, query: str, context: List[str] = None) -> str:
+        """Generate a response based on the query and optional context.
+        
+        Args:
+            query: User query
+            context: Optional context from memory to consider in generation
+            
+        Returns:
+            Generated response as a string
+        """
+        # Record the start time on the monotonic clock
+        start_ns = time.perf_counter_ns()
+        
+        # Convert empty string context to empty list
+        if context == "":
+            context = []
+            
+        # Debug logging to track context usage
+        if context:
+            logger.debug(f"Using context with {len(context)} items for query: {query[:50]}...")
+        else:
+            logger.debug(f"No context provided for query: {query[:50]}...")
+            
+        # Reuse a previous response when generation is (near) deterministic
+        cache_key = self._response_cache_key(query, context)
+        if cache_key is not None and cache_key in self._response_cache:
+            self._response_cache.move_to_end(cache_key)
+            logger.debug(f"Response cache hit for query: {query[:50]}...")
+            return self._response_cache[cache_key]
+        
+        # Concurrent requests are generated together in one batched generate() call
+        if self._batch_queue is not None:
+            future = Future()
+            self._batch_queue.put((query, context or [], cache_key, start_ns, future))
+            return future.result()
+        
+        return self._generate_single_response(query, context, cache_key, start_ns)
+    
+    def _generate_single_response(self, query: str, context: Optional[List[str]],
+                                  cache_key: Optional[tuple], start_ns: int) -> str:
+        """Generate, log and cache the response to a single query.
+        
+        Args:
+            query: User query
+            context: Optional context from memory to consider in generation
+            cache_key: Response cache key from _response_cache_key
+            start_ns: perf_counter_ns value when the request arrived
+            
+        Returns:
+            Generated response, or GENERATION_ERROR_RESPONSE on failure
+        """
+        # Prepare context for the prompt
+        prompt = self._prepare_prompt(query, context)
+        # The prompt messages copy the whole prompt, so they are only built when emitted
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"PREPARED PROMPT:\n {prompt}\n Context length: {len(context) if context else 0}")
+            
+            # Debug log the complete prompt being sent to the model
+            logger.info(f"FULL PROMPT SENT TO MODEL:\n{'-'*50}\n{prompt}\n{'-'*50}")
+        
+        # Generate response
+        try:
+            if self._inference_client is not None:
+                response = self._clean_decoded_text(
+                    self._inference_client.complete(prompt, self._server_sampling_params())
+                )
+            else:
+                response = self._generate_with_model(prompt, context)
+            
+            # Additional cleanup to prevent over-generation
+            response = self._prevent_over_generation(response)
+            
+            # Log the interaction with timestamp in structured format; the record is
+            # only built when the interaction log is enabled at this level
+            if llm_logger.isEnabledFor(logging.INFO):
+                interaction_log = {
+                    "query": query,
+                    "context_length": len(context) if context else 0,
+                    "response": response,
+                    "duration_seconds": (time.perf_counter_ns() - start_ns) / 1e9,
+                    "model": self._model_name
+                }
+                
+                # Log as JSON for easy parsing
+                llm_logger.info(_InteractionRecord(interaction_log))
+            
+            self._store_cached_response(cache_key, response)
+            
+            return response
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            
+            # Log the error in interaction log
+            if llm_logger.isEnabledFor(logging.ERROR):
+                error_log = {
+                    "query": query,
+                    "context_length": len(context) if context else 0,
+                    "error": str(e),
+                    "model": self._model_name
+                }
+                llm_logger.error(_InteractionRecord(error_log))
+            
+            # Store critical error for potential communication
+            self._last_critical_error = f"Błąd generowania odpowiedzi: {str(e)}"
+            
+            return GENERATION_ERROR_RESPONSE
+    
+    def _generate_with_model(self, prompt: str, context: Optional[List[str]] = None) -> str:
+        """Generate a response for a prepared prompt with the locally loaded model.
+        
+        Args:
+            prompt: Fully formatted prompt
+            context: Context the prompt was prepared from
+            
+        Returns:
+            Decoded and cleaned response, before the over-generation cut-off
+        """
+        # Encode the prompt; bucket padding of a compiled model is masked out
+        input_ids, attention_mask = self._encode_generation_inputs(prompt, context)
+        
+        # Store input length for proper response extraction
+        input_length = input_ids.shape[1]
+        
+        gen_kwargs = self._build_gen_kwargs(input_length)
+        
+        # Speculative decoding keeps greedy output unchanged; with sampling it only
+        # preserves the output distribution, so it is limited to low temperatures
+        if self.assistant_model is not None and (
+            not gen_kwargs["do_sample"] or gen_kwargs["temperature"] <= 0.3
+        ):
+            gen_kwargs["assistant_model"] = self.assistant_model
+            # Assisted generation rolls back rejected tokens, which a static cache does not support
+            gen_kwargs.pop("cache_implementation", None)
+        
+        cache_kwargs = (
+            self._static_cache_kwargs(input_length, gen_kwargs)
+            or self._prefix_cache_kwargs(input_ids, gen_kwargs)
+        )
+        # Sentence completion continues from this generation's KV cache
+        sentence_completion = self.config.get('enable_sentence_completion', False)
+        output_kwargs = {"return_dict_in_generate": True} if sentence_completion else {}
+        try:
+            # inference_mode also skips the autograd version counters no_grad still maintains
+            with torch.inference_mode(), self._autocast():
+                outputs = self.model.generate(
+                    input_ids,
+                    attention_mask=attention_mask,
+                    **{**gen_kwargs, **cache_kwargs, **output_kwargs}
+                )
+        finally:
+            self._release_static_cache(cache_kwargs)
+        sequences = outputs.sequences if sentence_completion else outputs
+        
+        # Decode only the generated tokens (beyond the input); the prompt is never decoded
+        generated_tokens = sequences[0][input_length:]
+        generated_text = self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
+        response = self._clean_decoded_text(generated_text)
+        
+        logger.debug(f"Input length: {input_length} tokens, Generated length: {len(generated_tokens)} tokens")
+        logger.debug(f"Extracted response (first 100 chars): {response[:100]}...")
+        
+        if not response:
+            logger.warning("Model generated an empty response")
+        
+        # Check if response was cut off mid-sentence and try to complete it (if enabled)
+        if sentence_completion:
+            continuation = None
+            # The cached keys/values can be continued only if they are private to this call,
+            # generation stopped at the token limit and the response is the generated text
+            # itself (not cut or cleaned up)
+            if ("cache_implementation" not in gen_kwargs and "assistant_model" not in gen_kwargs
+                    and outputs.past_key_values is not None
+                    and len(generated_tokens) == gen_kwargs["max_new_tokens"]
+                    and response == generated_text.strip()):
+                continuation = (sequences, outputs.past_key_values)
+            # Bucket padding of a compiled model is not part of the prompt
+            prompt_ids = input_ids[:, attention_mask[0].bool()]
+            response = self._ensure_sentence_completion(response, prompt_ids, gen_kwargs, continuation)
+        
+        return response
+    
+    def _build_gen_kwargs(self, input_length: int) -> Dict[str, Any]:
+        """Build keyword arguments for model.generate from the current config.
+        
+        Args:
+            input_length: Length of the (padded) prompt in tokens
+            
+        Returns:
+            Dictionary of generation parameters
+        """
+        # Set a generation config using parameters from config; the config is read on
+        # every call because experiments change generation parameters at runtime
+        gen_kwargs = {
+            **self._gen_kwargs_template,
+            "temperature": self.config.get('temperature', 0.7),
+            "do_sample": self.config.get('do_sample', True),
+            # All parameters from config with sensible defaults
+            "max_new_tokens": self.config.get('max_new_tokens', 150),
+            "min_length": self.config.get('min_length', 10),
+            "repetition_penalty": self.config.get('repetition_penalty', 1.2),
+            "no_repeat_ngram_size": self.config.get('no_repeat_ngram_size', 3),
+            # New sampling parameters - use more permissive defaults
+            "top_p": self.config.get('top_p', 0.95),
+            "top_k": self.config.get('top_k', 0),  # 0 = disabled
+        }
+        
+        # Never ask for more new tokens than fit in the context window after the prompt;
+        # a prompt that already fills it cannot be continued at all
+        if self._model_context_length is not None:
+            room = self._model_context_length - input_length
+            if room <= 0:
+                raise ValueError(f"Prompt of {input_length} tokens leaves no room in the "
+                                 f"model context of {self._model_context_length} tokens")
+            gen_kwargs["max_new_tokens"] = min(gen_kwargs["max_new_tokens"], room)
+        
+        # A compiled forward pass sees fixed-size KV tensors, so each prompt bucket
+        # replays the same CUDA graphs instead of recompiling as the cache grows
+        if self._model_compiled:
+            gen_kwargs["cache_implementation"] = "static"
+        
+        # min_length counts prompt tokens too, so it only constrains generation
+        # for prompts shorter than it; otherwise skip the per-step logits processor
+        if gen_kwargs["min_length"] <= input_length:
+            del gen_kwargs["min_length"]
+        
+        # Greedy decoding ignores the sampling parameters; passing them anyway only
+        # makes generate() validate them and warn that they are unused
+        if not gen_kwargs["do_sample"]:
+            for key in SAMPLING_PARAMS:
+                del gen_kwargs[key]
+        
+        # Handle stop sequences if provided
+        stop_sequences = self.config.get('stop', [])
+        if stop_sequences:
+            all_stop_ids = self._stop_token_ids(stop_sequences)
+            if all_stop_ids:
+                gen_kwargs["eos_token_id"] = all_stop_ids
+        
+        return gen_kwargs
+    
+    def _stop_token_ids(self, stop_sequences: List[str]) -> List[int]:
+        """Convert stop sequences to the token ids that end generation.
+        
+        The ids are computed with one batched tokenizer call and kept until the
+        configured stop sequences change.
+        
+        Args:
+            stop_sequences: Stop sequences from the config
+            
+        Returns:
+            Stop token ids together with eos_token_id, or an empty list if the
+            sequences produce no tokens
+        """
+        key = tuple(stop_sequences)
+        if self._stop_ids_cache is not None and self._stop_ids_cache[0] == key:
+            return self._stop_ids_cache[1]
+        
+        logger.debug(f"Processing stop sequences: {stop_sequences}")
+        # Convert stop sequences to token IDs
+        texts = [stop_seq for stop_seq in stop_sequences if isinstance(stop_seq, str)]
+        stop_token_ids = []
+        if texts:
+            encoded = self.tokenizer(texts, add_special_tokens=False)
+            stop_token_ids = [token for ids in encoded["input_ids"] for token in ids]
+        
+        all_stop_ids = []
+        if stop_token_ids:
+            # Remove duplicates and add to existing eos_token_id
+            existing_stop_ids = [self.tokenizer.eos_token_id] if hasattr(self.tokenizer, 'eos_token_id') else []
+            all_stop_ids = list(set(existing_stop_ids + stop_token_ids))
+        
+        self._stop_ids_cache = (key, all_stop_ids)
+        return all_stop_ids
+    
+    def _server_sampling_params(self) -> Dict[str, Any]:
+        """Build sampling parameters for the inference server from the current config.
+        
+        Mirrors _build_gen_kwargs; the server tokenizes the prompt, enforces its own
+        context window and matches stop sequences as strings.
+        
+        Returns:
+            Sampling parameters in OpenAI completions format
+        """
+        params = {
+            "max_tokens": self.config.get('max_new_tokens', 150),
+            # Greedy decoding is requested with a zero temperature
+            "temperature": self.config.get('temperature', 0.7) if self.config.get('do_sample', True) else 0.0,
+            "top_p": self.config.get('top_p', 0.95),
+            "repetition_penalty": self.config.get('repetition_penalty', 1.2),
+        }
+        top_k = self.config.get('top_k', 0)
+        if top_k > 0:
+            params["top_k"] = top_k
+        stop_sequences = self.config.get('stop', [])
+        if stop_sequences:
+            params["stop"] = stop_sequences
+        return params
+    
+    def _init_request_batcher(self) -> None:
+        """Start the micro-batching worker when `max_batch_size` is above 1.
+        
+        generate_response then enqueues its request and waits; the worker collects
+        requests arriving within `batch_window_ms` of the first one (up to
+        `max_batch_size`) and generates them with generate_responses_batch, so
+        concurrent callers share the weight reads of each decoding step. A request
+        that arrives alone takes the regular single-request path.
+        """
+        max_batch_size = self.config.get('max_batch_size', 1)
+        if max_batch_size <= 1:
+            return
+        
+        self._batch_queue = queue.Queue()
+        worker = threading.Thread(
+            target=self._run_request_batcher,
+            args=(max_batch_size, self.config.get('batch_window_ms', 10) / 1000),
+            name="ModelRequestBatcher",
+            daemon=True
+        )
+        worker.start()
+        logger.info(f"Micro-batching up to {max_batch_size} concurrent requests")
+    
+    def _run_request_batcher(self, max_batch_size: int, batch_window: float) -> None:
+        """Collect queued requests into batches and fulfil their futures.
+        
+        Args:
+            max_batch_size: Maximum number of requests generated together
+            batch_window: Seconds to wait for more requests after the first one arrives
+        """
+        while True:
+            batch = [self._batch_queue.get()]
+            deadline = time.monotonic() + batch_window
+            while len(batch) < max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._batch_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                if len(batch) == 1:
+                    # A lone request keeps the single-request path (prefix KV cache, sentence completion)
+                    query, context, cache_key, start_ns, future = batch[0]
+                    future.set_result(self._generate_single_response(query, context, cache_key, start_ns))
+                    continue
+                responses = self.generate_responses_batch(
+                    [query for query, _, _, _, _ in batch],
+                    [context for _, context, _, _, _ in batch]
+                )
+            except Exception as e:
+                for _, _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, _, cache_key, _, future), response in zip(batch, responses):
+                if response != GENERATION_ERROR_RESPONSE:
+                    self._store_cached_response(cache_key, response)
+                future.set_result(response)
+    
+    def generate_response_stream(self, query: str, context: List[str] = None) -> Iterator[str]:
+        """Generate a response, yielding text chunks as soon as they are decoded.
+        
+        Generation runs on a background thread while the caller consumes chunks,
+        so the first words are available after a single decoding step. Chunks are
+        raw model output; the cleaned response (corruption cleanup and
+        over-generation cut-off, as in generate_response) is the generator's
+        return value.
+        
+        Args:
+            query: User query
+            context: Optional context from memory to consider in generation
+            
+        Yields:
+            Decoded text chunks in generation order
+            
+        Returns:
+            Cleaned complete response
+        """
+        if self._inference_client is not None:
+            # The server response arrives in one piece
+            response = self.generate_response(query, context)
+            yield response
+            return response
+        
+        start_ns = time.perf_counter_ns()
+        if context == "":
+            context = []
+        
+        prompt = self._prepare_prompt(query, context)
+        input_ids, attention_mask = self._encode_generation_inputs(prompt, context)
+        try:
+            gen_kwargs = self._build_gen_kwargs(input_ids.shape[1])
+        except ValueError as e:
+            # A prompt that fills the context gets the same error response as generate_response
+            logger.error(f"Error generating streamed response: {e}")
+            if llm_logger.isEnabledFor(logging.ERROR):
+                llm_logger.error(_InteractionRecord({
+                    "query": query,
+                    "context_length": len(context) if context else 0,
+                    "error": str(e),
+                    "streamed": True,
+                    "model": self._model_name
+                }))
+            self._last_critical_error = f"Błąd generowania odpowiedzi: {str(e)}"
+            yield GENERATION_ERROR_RESPONSE
+            return GENERATION_ERROR_RESPONSE
+        
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+        
+        def run_generation():
+            cache_kwargs = (
+                self._static_cache_kwargs(input_ids.shape[1], gen_kwargs)
+                or self._prefix_cache_kwargs(input_ids, gen_kwargs)
+            )
+            try:
+                with torch.inference_mode(), self._autocast():
+                    self.model.generate(
+                        input_ids, attention_mask=attention_mask, streamer=streamer,
+                        **{**gen_kwargs, **cache_kwargs}
+                    )
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer waiting on the streamer
+                streamer.end()
+            finally:
+                self._release_static_cache(cache_kwargs)
+        
+        generation_thread = threading.Thread(target=run_generation, daemon=True)
+        generation_thread.start()
+        
+        chunks = []
+        for chunk in streamer:
+            chunks.append(chunk)
+            yield chunk
+        generation_thread.join()
+        
+        if errors:
+            logger.error(f"Error generating streamed response: {errors[0]}")
+            raise errors[0]
+        
+        response = self._prevent_over_generation(self._clean_decoded_text("".join(chunks)))
+        
+        if llm_logger.isEnabledFor(logging.INFO):
+            llm_logger.info(_InteractionRecord({
+                "query": query,
+                "context_length": len(context) if context else 0,
+                "response": response,
+                "duration_seconds": (time.perf_counter_ns() - start_ns) / 1e9,
+                "streamed": True,
+                "model": self._model_name
+            }))
+        
+        return response
+    
+    def generate_responses_batch(self, queries: List[str], contexts: Optional[List[List[str]]] = None) -> List[str]:
+        """Generate responses for several queries with a single model.generate call.
+        
+        All queries share the generation parameters from the current config.
+        
+        Args:
+            queries: User queries
+            contexts: Optional context list for each query
+            
+        Returns:
+            Generated responses in the order of the queries
+        """
+        if not queries:
+            return []
+        if contexts is None:
+            contexts = [[] for _ in queries]
+        
+        start_ns = time.perf_counter_ns()
+        prompts = [self._prepare_prompt(query, context) for query, context in zip(queries, contexts)]
+        logger.info(f"Generating batch of {len(prompts)} responses")
+        
+        try:
+            if self._inference_client is not None:
+                texts = self._inference_client.complete_batch(prompts, self._server_sampling_params())
+                responses = [self._prevent_over_generation(self._clean_decoded_text(text)) for text in texts]
+            else:
+                if self._prompt_prefix_ids and all(prompt.startswith(self._prompt_prefix) for prompt in prompts):
+                    input_ids, attention_mask = self._encode_prompt_batch(prompts)
+                else:
+                    # Decoder-only models must be padded on the left so generation continues every prompt
+                    padding_side = self.tokenizer.padding_side
+                    self.tokenizer.padding_side = "left"
+                    try:
+                        encoded = self.tokenizer(
+                            prompts, return_tensors="pt", padding=True, add_special_tokens=self._add_special_tokens
+                        )
+                    finally:
+                        self.tokenizer.padding_side = padding_side
+                    
+                    input_ids = encoded["input_ids"].to(self._device)
+                    attention_mask = encoded["attention_mask"].to(self._device)
+                if self._model_compiled:
+                    input_ids, attention_mask = self._pad_to_bucket(input_ids, attention_mask)
+                input_length = input_ids.shape[1]
+                
+                gen_kwargs = self._build_gen_kwargs(input_length)
+                with torch.inference_mode(), self._autocast():
+                    outputs = self.model.generate(
+                        input_ids,
+                        attention_mask=attention_mask,
+                        **gen_kwargs
+                    )
+                
+                responses = []
+                for output in outputs:
+                    response = self._decode_new_tokens(output[input_length:])
+                    responses.append(self._prevent_over_generation(response))
+            
+            if llm_logger.isEnabledFor(logging.INFO):
+                duration = (time.perf_counter_ns() - start_ns) / 1e9
+                for query, context, response in zip(queries, contexts, responses):
+                    llm_logger.info(_InteractionRecord({
+                        "query": query,
+                        "context_length": len(context) if context else 0,
+                        "response": response,
+                        "duration_seconds": duration,
+                        "batch_size": len(queries),
+                        "model": self._model_name
+                    }))
             
-            logger.info(f"🎉 Model {config['base_model']} loaded successfully! System ready to receive messages.")
+            return responses
         except Exception as e:
-            logger.error(f"Error loading model: {e}")
-            # Try to send error notification if communication interface is available
-            try:
-                # This will be called from main.py which has access to communication
-                self._model_loading_error = str(e)
-            except:
-                pass
-            raise
+            logger.error(f"Error generating batch responses: {e}")
+            if llm_logger.isEnabledFor(logging.ERROR):
+                llm_logger.error(_InteractionRecord({
+                    "batch_size": len(queries),
+                    "error": str(e),
+                    "model": self._model_name
+                }))
+            self._last_critical_error = f"Błąd generowania odpowiedzi: {str(e)}"
+            return [GENERATION_ERROR_RESPONSE] * len(queries)
     
-    def generate_response(self, query: str, context: List[str] = None) -> str:
-        """Generate a response based on the query and optional context.
+    def _response_cache_key(self, query: str, context: Optional[List[str]]) -> Optional[tuple]:
+        """Build the response cache key for a request.
         
         Args:
             query: User query
-            context: Optional context from memory to consider in generation
+            context: Optional context list
             
         Returns:
-            Generated response as a string
+            Hashable cache key, or None if the response should not be cached
         """
-        # Record the start time
-        start_time = datetime.now()
+        if not self.config.get('enable_response_cache', True):
+            return None
         
-        # Convert empty string context to empty list
-        if context == "":
-            context = []
-            
-        # Debug logging to track context usage
-        if context:
-            logger.debug(f"Using context with {len(context)} items for query: {query[:50]}...")
-        else:
-            logger.debug(f"No context provided for query: {query[:50]}...")
-            
-        # Prepare context for the prompt
-        prompt = self._prepare_prompt(query, context)
-        logger.info(f"PREPARED PROMPT:\n {prompt}\n Context length: {len(context) if context else 0}")
+        # Sampled output at higher temperatures is meant to vary between calls
+        if self.config.get('do_sample', True) and self.config.get('temperature', 0.7) > 0.3:
+            return None
         
-        # Debug log the complete prompt being sent to the model
-        logger.info(f"FULL PROMPT SENT TO MODEL:\n{'-'*50}\n{prompt}\n{'-'*50}")
+        gen_params = tuple(self.config.get(name) for name in RESPONSE_CACHE_PARAMS)
+        stop = tuple(self.config.get('stop', []))
+        return (query, tuple(context or ()), gen_params, stop)
+    
+    def _store_cached_response(self, cache_key: Optional[tuple], response: str) -> None:
+        """Store a response in the bounded LRU cache.
         
-        # Encode the prompt
-        input_ids = self.tokenizer.encode(prompt, return_tensors="pt").to(self.model.device)
+        Args:
+            cache_key: Key from _response_cache_key, or None if the response is not cached
+            response: Generated response
+        """
+        if cache_key is None:
+            return
+        self._response_cache[cache_key] = response
+        if len(self._response_cache) > self._response_cache_size:
+            self._response_cache.popitem(last=False)
+    
+    def clear_response_cache(self) -> None:
+        """Drop all cached responses, e.g. after generation parameters change."""
+        self._response_cache.clear()
+    
+    def _init_prompt_prefix_cache(self) -> None:
+        """Tokenize the static head of every prompt once, so requests only encode the rest.
         
-        # Store input length for proper response extraction
-        input_length = input_ids.shape[1]
+        Only the system prompt head is cached. The short user/assistant markers are
+        encoded together with the query: BPE merges across the seams around the
+        query text, so pieces encoded separately would not match the full prompt.
+        """
+        self._prompt_prefix = PROMPT_HEADER
+        self._prompt_prefix_ids = None
+        self._persona_prefix_ids = OrderedDict()
         
-        # Generate response
         try:
-            # Set a generation config using parameters from config
-            gen_kwargs = {
-                "temperature": self.config.get('temperature', 0.7),
-                "do_sample": self.config.get('do_sample', True),
-                "num_return_sequences": 1,
-                "pad_token_id": self.tokenizer.eos_token_id,
-                "eos_token_id": self.tokenizer.eos_token_id,
-                # All parameters from config with sensible defaults
-                "max_new_tokens": self.config.get('max_new_tokens', 150),
-                "min_length": self.config.get('min_length', 10),
-                "repetition_penalty": self.config.get('repetition_penalty', 1.2),
-                "no_repeat_ngram_size": self.config.get('no_repeat_ngram_size', 3),
-                # New sampling parameters - use more permissive defaults
-                "top_p": self.config.get('top_p', 0.95),
-                "top_k": self.config.get('top_k', 0)  # 0 = disabled
-                #"early_stopping": True
-            }
+            prefix_ids = list(self.tokenizer.encode(self._prompt_prefix, add_special_tokens=self._add_special_tokens))
             
-            # Handle stop sequences if provided
-            stop_sequences = self.config.get('stop', [])
-            if stop_sequences:
-                logger.debug(f"Processing stop sequences: {stop_sequences}")
-                # Convert stop sequences to token IDs
-                stop_token_ids = []
-                for stop_seq in stop_sequences:
-                    if isinstance(stop_seq, str):
-                        tokens = self.tokenizer.encode(stop_seq, add_special_tokens=False)
-                        if tokens:
-                            stop_token_ids.extend(tokens)
-                
-                if stop_token_ids:
-                    # Remove duplicates and add to existing eos_token_id
-                    existing_stop_ids = [self.tokenizer.eos_token_id] if hasattr(self.tokenizer, 'eos_token_id') else []
-                    all_stop_ids = list(set(existing_stop_ids + stop_token_ids))
-                    gen_kwargs["eos_token_id"] = all_stop_ids
+            # Reusing the prefix is only safe if encoding the pieces separately yields
+            # exactly the ids of the whole prompt for this tokenizer
+            for probe in (self._prepare_prompt("probe", None), self._prepare_prompt("probe", ["probe"])):
+                suffix_ids = list(self.tokenizer.encode(probe[len(self._prompt_prefix):], add_special_tokens=False))
+                probe_ids = list(self.tokenizer.encode(probe, add_special_tokens=self._add_special_tokens))
+                if prefix_ids + suffix_ids != probe_ids:
+                    logger.debug("Prompt prefix tokenization is context-dependent, prefix cache disabled")
+                    return
             
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    input_ids,
-                    **gen_kwargs
-                )
+            self._prompt_prefix_ids = prefix_ids
+            logger.debug(f"Cached {len(prefix_ids)} prompt prefix tokens")
+        except Exception as e:
+            logger.warning(f"Could not cache prompt prefix tokens: {e}")
+    
+    def _persona_prompt_prefix(self, prompt: str, context: Optional[List[str]]):
+        """Return the cached head of a prompt that starts with a persona context.
+        
+        PersonaManager puts the same persona description first in the context of
+        every query, so the system prompt head plus the persona is tokenized once
+        per persona. The split is probed like the system prompt head; a persona
+        whose seam tokenizes differently is remembered as unusable.
+        
+        Args:
+            prompt: Complete prompt produced by _prepare_prompt
+            context: Context the prompt was prepared from
             
-            # NEW APPROACH: Extract only the generated tokens (beyond the input)
-            # This prevents including the prompt in the response
-            generated_tokens = outputs[0][input_length:]
-            # Decode only the generated part
-            response = self.tokenizer.decode(generated_tokens, skip_special_tokens=True).strip()
+        Returns:
+            Tuple (prefix, prefix_ids), or None if no persona head applies
+        """
+        if not self._prompt_prefix_ids or not context or not _is_persona_context(context[0]):
+            return None
+        
+        prefix = f"{self._prompt_prefix}\n\n{context[0]}"
+        if not prompt.startswith(prefix):
+            return None
+        
+        if prefix in self._persona_prefix_ids:
+            self._persona_prefix_ids.move_to_end(prefix)
+        else:
+            prefix_ids = list(self.tokenizer.encode(prefix, add_special_tokens=self._add_special_tokens))
+            for probe in (self._prepare_prompt("probe", [context[0]]),
+                          self._prepare_prompt("probe", [context[0], "probe"])):
+                suffix_ids = list(self.tokenizer.encode(probe[len(prefix):], add_special_tokens=False))
+                probe_ids = list(self.tokenizer.encode(probe, add_special_tokens=self._add_special_tokens))
+                if prefix_ids + suffix_ids != probe_ids:
+                    logger.debug("Persona prompt head tokenization is context-dependent, not cached")
+                    prefix_ids = None
+                    break
             
-            # Debug logging to verify the fix
-            logger.debug(f"Input length: {input_length} tokens, Generated length: {len(generated_tokens)} tokens")
-            logger.debug(f"Extracted response (first 100 chars): {response[:100]}...")
+            self._persona_prefix_ids[prefix] = prefix_ids
+            if len(self._persona_prefix_ids) > PERSONA_PREFIX_CACHE_SIZE:
+                self._persona_prefix_ids.popitem(last=False)
+        
+        prefix_ids = self._persona_prefix_ids[prefix]
+        return (prefix, prefix_ids) if prefix_ids else None
+    
+    def _init_prefix_kv_cache(self) -> None:
+        """Run the system prompt head through the model once and keep its KV cache.
+        
+        Every prompt starts with the same tokenized head, so its attention keys and
+        values are identical across requests; generate() then only prefills the
+        query part. Opt-in via the `cache_prompt_prefix_kv` config key. Not used
+        with a compiled model, whose bucket padding shifts the prompt positions.
+        """
+        self._prefix_kv_cache = None
+        if not self.config.get('cache_prompt_prefix_kv', False):
+            return
+        if not self._prompt_prefix_ids or self._model_compiled:
+            logger.info("Prompt prefix KV cache unavailable for this model setup")
+            return
+        
+        try:
+            prefix_ids = torch.tensor([self._prompt_prefix_ids], dtype=torch.long, device=self._device)
+            with torch.inference_mode(), self._autocast():
+                self._prefix_kv_cache = self.model(prefix_ids, use_cache=True).past_key_values
+            logger.info(f"Cached KV states for {len(self._prompt_prefix_ids)} prompt prefix tokens")
+        except Exception as e:
+            logger.warning(f"Could not cache prompt prefix KV states: {e}")
+    
+    def _prefix_cache_kwargs(self, input_ids: torch.Tensor, gen_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Return generate() arguments that reuse the prompt prefix KV cache, if applicable.
+        
+        Args:
+            input_ids: Encoded prompt with a batch dimension
+            gen_kwargs: Generation parameters for this call
             
-            # If we got an empty response, fall back to the old method for debugging
-            if not response.strip():
-                logger.warning("Empty response from new extraction method, falling back to old method")
-                generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-                response = self._extract_response(generated_text, prompt)
+        Returns:
+            Dictionary with a private copy of the prefix cache, or an empty dictionary
+        """
+        if self._prefix_kv_cache is None or "assistant_model" in gen_kwargs:
+            return {}
+        prefix_length = len(self._prompt_prefix_ids)
+        if input_ids.shape[1] <= prefix_length or input_ids[0, :prefix_length].tolist() != self._prompt_prefix_ids:
+            return {}
+        # generate() appends to the cache in place, so each call gets its own copy
+        return {"past_key_values": copy.deepcopy(self._prefix_kv_cache)}
+    
+    def _init_static_cache(self) -> None:
+        """Allocate one StaticCache for the compiled model, reused across generate() calls.
+        
+        With cache_implementation="static" generate() allocates fresh key/value
+        tensors on every call. The persistent cache is sized once, to
+        `max_cache_len` (default: the largest prompt bucket plus `max_new_tokens`,
+        within the context window), and only zeroed between calls.
+        """
+        self._static_cache = None
+        self._static_cache_len = 0
+        self._static_cache_lock = threading.Lock()
+        
+        cache_len = self.config.get(
+            'max_cache_len', PROMPT_LENGTH_BUCKETS[-1] + self.config.get('max_new_tokens', 150)
+        )
+        if self._model_context_length is not None:
+            cache_len = min(cache_len, self._model_context_length)
+        
+        try:
+            # max_batch_size, device and dtype are needed by older transformers releases;
+            # newer ones allocate lazily on first use
+            self._static_cache = StaticCache(
+                config=self.model.config, max_cache_len=cache_len, max_batch_size=1,
+                device=self._device, dtype=self.model.dtype
+            )
+            self._static_cache_len = cache_len
+            logger.info(f"Allocated static KV cache for {cache_len} tokens")
+        except Exception as e:
+            logger.warning(f"Could not allocate static KV cache, generate() will allocate per call: {e}")
+    
+    def _static_cache_kwargs(self, input_length: int, gen_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Return generate() arguments that use the persistent static cache, if it is free.
+        
+        A caller that receives a non-empty dictionary must pass it to
+        _release_static_cache after generate() returns.
+        
+        Args:
+            input_length: Length of the encoded prompt
+            gen_kwargs: Generation parameters for this call
             
-            # Check if response was cut off mid-sentence and try to complete it (if enabled)
-            if self.config.get('enable_sentence_completion', False):
-                response = self._ensure_sentence_completion(response, input_ids, gen_kwargs)
+        Returns:
+            Dictionary replacing cache_implementation with the reset cache, or an
+            empty dictionary (generate() then allocates its own cache)
+        """
+        if self._static_cache is None or gen_kwargs.get("cache_implementation") != "static":
+            return {}
+        if input_length + gen_kwargs["max_new_tokens"] > self._static_cache_len:
+            return {}
+        # Concurrent requests (streaming, micro-batching) fall back to their own cache
+        if not self._static_cache_lock.acquire(blocking=False):
+            return {}
+        # The cache tensors are created under inference_mode and may only be zeroed there
+        with torch.inference_mode():
+            self._static_cache.reset()
+        return {"cache_implementation": None, "past_key_values": self._static_cache}
+    
+    def _release_static_cache(self, cache_kwargs: Dict[str, Any]) -> None:
+        """Release the persistent static cache if cache_kwargs holds it.
+        
+        Args:
+            cache_kwargs: Dictionary returned by _static_cache_kwargs or _prefix_cache_kwargs
+        """
+        if self._static_cache is not None and cache_kwargs.get("past_key_values") is self._static_cache:
+            self._static_cache_lock.release()
+    
+    def _init_pinned_input_buffer(self) -> None:
+        """Allocate a reusable pinned host buffer for copying input ids to the GPU."""
+        self._pinned_ids = None
+        self._pinned_copy_done = None
+        self._pinned_lock = threading.Lock()
+        
+        if not torch.cuda.is_available() or getattr(self._device, "type", None) != "cuda":
+            return
+        
+        try:
+            self._pinned_ids = torch.empty(
+                (1, self.config.get('max_length', 2048)), dtype=torch.long, pin_memory=True
+            )
+        except Exception as e:
+            logger.warning(f"Could not allocate pinned input buffer: {e}")
+    
+    def _copy_ids_to_device(self, ids: List[int]) -> torch.Tensor:
+        """Copy token ids to the model device through the pinned host buffer.
+        
+        Args:
+            ids: Token ids that fit in the pinned buffer
             
-            # Additional cleanup to prevent over-generation
-            response = self._prevent_over_generation(response)
+        Returns:
+            Tensor of input ids with a batch dimension on the model device
+        """
+        with self._pinned_lock:
+            # The buffer may only be overwritten once the previous asynchronous copy finished
+            if self._pinned_copy_done is not None:
+                self._pinned_copy_done.synchronize()
             
-            # Record end time and calculate duration
-            end_time = datetime.now()
-            duration = (end_time - start_time).total_seconds()
+            length = len(ids)
+            self._pinned_ids[0, :length].copy_(torch.as_tensor(ids, dtype=torch.long))
+            input_ids = self._pinned_ids[:, :length].to(self._device, non_blocking=True)
             
-            # Log the interaction with timestamp in structured format
-            interaction_log = {
-                "timestamp": end_time.isoformat(),
-                "query": query,
-                "context_length": len(context) if context else 0,
-                "response": response,
-                "duration_seconds": duration,
-                "model": self.config.get('base_model', 'unknown')
-            }
+            self._pinned_copy_done = torch.cuda.Event()
+            self._pinned_copy_done.record()
+            return input_ids
+    
+    def _prompt_token_ids(self, prompt: str, context: Optional[List[str]] = None) -> List[int]:
+        """Tokenize the prompt, reusing the cached ids of the fixed prompt prefix.
+        
+        Args:
+            prompt: Complete prompt produced by _prepare_prompt
+            context: Context the prompt was prepared from, used to reuse a persona head
             
-            # Log as JSON for easy parsing
-            llm_logger.info(json.dumps(interaction_log))
+        Returns:
+            List of token ids
+        """
+        persona_prefix = self._persona_prompt_prefix(prompt, context)
+        if persona_prefix is not None:
+            prefix, prefix_ids = persona_prefix
+            return prefix_ids + list(self.tokenizer.encode(prompt[len(prefix):], add_special_tokens=False))
+        if self._prompt_prefix_ids and prompt.startswith(self._prompt_prefix):
+            suffix_ids = self.tokenizer.encode(prompt[len(self._prompt_prefix):], add_special_tokens=False)
+            return self._prompt_prefix_ids + list(suffix_ids)
+        return list(self.tokenizer.encode(prompt, add_special_tokens=self._add_special_tokens))
+    
+    def _ids_to_device(self, ids: List[int]) -> torch.Tensor:
+        """Move token ids to the model device, through the pinned buffer when they fit.
+        
+        Args:
+            ids: Token ids
             
-            return response
-        except Exception as e:
-            logger.error(f"Error generating response: {e}")
+        Returns:
+            Tensor of input ids with a batch dimension on the model device
+        """
+        if self._pinned_ids is not None and len(ids) <= self._pinned_ids.shape[1]:
+            return self._copy_ids_to_device(ids)
+        return torch.tensor([ids], dtype=torch.long).to(self._device)
+    
+    def _encode_prompt(self, prompt: str, context: Optional[List[str]] = None) -> torch.Tensor:
+        """Encode the prompt into input ids on the model device.
+        
+        Args:
+            prompt: Complete prompt produced by _prepare_prompt
+            context: Context the prompt was prepared from
             
-            # Log the error in interaction log
-            error_log = {
-                "timestamp": datetime.now().isoformat(),
-                "query": query,
-                "context_length": len(context) if context else 0,
-                "error": str(e),
-                "model": self.config.get('base_model', 'unknown')
-            }
-            llm_logger.error(json.dumps(error_log))
+        Returns:
+            Tensor of input ids with a batch dimension
+        """
+        if self._pinned_ids is None and not (
+            self._prompt_prefix_ids and prompt.startswith(self._prompt_prefix)
+        ):
+            return self.tokenizer.encode(
+                prompt, add_special_tokens=self._add_special_tokens, return_tensors="pt"
+            ).to(self._device)
+        
+        return self._ids_to_device(self._prompt_token_ids(prompt, context))
+    
+    def _encode_generation_inputs(self, prompt: str, context: Optional[List[str]] = None):
+        """Encode the prompt into input ids and an attention mask for generate().
+        
+        For a compiled model the ids are left-padded to the PROMPT_LENGTH_BUCKETS
+        length on the host, so the padded prompt reaches the GPU in the single
+        pinned-buffer copy and the mask is built on the device, instead of
+        concatenating padding onto both tensors there.
+        
+        Args:
+            prompt: Complete prompt produced by _prepare_prompt
+            context: Context the prompt was prepared from
             
-            # Store critical error for potential communication
-            self._last_critical_error = f"Błąd generowania odpowiedzi: {str(e)}"
+        Returns:
+            Tuple of (input_ids, attention_mask) on the model device
+        """
+        if not self._model_compiled:
+            input_ids = self._encode_prompt(prompt, context)
+            # Every prompt position is attended to
+            return input_ids, input_ids.new_ones(input_ids.shape)
+        
+        ids = self._prompt_token_ids(prompt, context)
+        return self._left_pad_inputs(ids, self._bucket_length(len(ids)))
+    
+    def _left_pad_inputs(self, ids: List[int], length: int):
+        """Left-pad token ids to a length on the host and move them to the model device.
+        
+        Args:
+            ids: Prompt token ids, at most `length` of them
+            length: Padded length
+            
+        Returns:
+            Tuple of (input_ids, attention_mask) on the model device, with the
+            padding masked out
+        """
+        pad_length = length - len(ids)
+        input_ids = self._ids_to_device([self.tokenizer.pad_token_id] * pad_length + ids)
+        attention_mask = (torch.arange(length, device=input_ids.device) >= pad_length).long().unsqueeze(0)
+        return input_ids, attention_mask
+    
+    def _encode_prompt_batch(self, prompts: List[str]):
+        """Encode prompts that start with the cached prefix into a left-padded batch.
+        
+        Only the part after the prefix is tokenized; the cached prefix ids are
+        prepended to every row.
+        
+        Args:
+            prompts: Complete prompts produced by _prepare_prompt
             
-            return "I'm sorry, there was a technical problem generating the response."
+        Returns:
+            Tuple (input_ids, attention_mask) on the model device
+        """
+        prefix_length = len(self._prompt_prefix)
+        suffix_ids = self.tokenizer(
+            [prompt[prefix_length:] for prompt in prompts], add_special_tokens=False
+        )["input_ids"]
+        sequences = [self._prompt_prefix_ids + list(ids) for ids in suffix_ids]
+        
+        # Decoder-only models must be padded on the left so generation continues every prompt
+        max_length = max(len(ids) for ids in sequences)
+        input_ids = torch.full(
+            (len(sequences), max_length), self._gen_kwargs_template["pad_token_id"], dtype=torch.long
+        )
+        attention_mask = torch.zeros((len(sequences), max_length), dtype=torch.long)
+        for row, ids in enumerate(sequences):
+            input_ids[row, max_length - len(ids):] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[row, max_length - len(ids):] = 1
+        return input_ids.to(self._device), attention_mask.to(self._device)
     
     def _prepare_prompt(self, query: str, context: Optional[List[str]]) -> str:
         """Prepare prompt from query and context.
@@ -297,31 +1826,71 @@ class ModelManager:
         # If context is empty but not None, it might be an empty list passed as context
         if not context:
             # If context is None or empty list, use basic prompt
-            return f"<|begin_of_text|>\n<|system|>\n{MODEL_PROMPT}\n<|user|>\n{query}\n<|assistant|>\n"
+            return f"{PROMPT_HEADER}\n<|user|>\n{query}\n<|assistant|>\n"
             
         # Check if the first context item is a persona context (added by PersonaManager)
         # or a regular context item (memory, etc.)
-        context_starts_with_persona = (
-            len(context) > 0 and isinstance(context[0], str) and 
-            (context[0].strip().startswith("You are ") or context[0].strip().startswith("Jesteś "))
-        )
-        if context_starts_with_persona and config["PERSONA"].get("enable_persona_in_prompt", False):
+        context_starts_with_persona = _is_persona_context(context[0])
+        if context_starts_with_persona and getattr(config, "PERSONA", {}).get("enable_persona_in_prompt", False):
             # This is a persona context from PersonaManager
             persona_context = context[0]
             remaining_context = context[1:] if len(context) > 1 else []
             
+            # Each prompt is assembled in a single join over its lines; empty items
+            # produce the blank separator lines and the trailing newline
             if remaining_context:
                 # We have both persona context and additional memory context
-                remaining_context_str = "\n".join(remaining_context)  # Remove "- " prefix for conversation context
-                return f"<|begin_of_text|>\n<|system|>\n{MODEL_PROMPT}\n\n{persona_context}\n\n{remaining_context_str}\n<|user|>\n{query}\n<|assistant|>\n"
+                # (conversation context lines are used as-is, without a "- " prefix)
+                return "\n".join([
+                    PROMPT_HEADER, "", persona_context, "", *remaining_context,
+                    "<|user|>", query, "<|assistant|>", ""
+                ])
             else:
                 # We only have persona context, no additional memory context
-                return f"<|begin_of_text|>\n<|system|>\n{MODEL_PROMPT}\n\n{persona_context}\n<|user|>\n{query}\n<|assistant|>\n"
+                return "\n".join([PROMPT_HEADER, "", persona_context, "<|user|>", query, "<|assistant|>", ""])
         else:
             # This is regular context, not persona context
-            # Special handling for conversation context
-            context_str = "\n".join(context)  # Remove "- " prefix for conversation context
-            return f"<|begin_of_text|>\n<|system|>\n{MODEL_PROMPT}\n\n{context_str}\n<|user|>\n{query}\n<|assistant|>\n"
+            # Special handling for conversation context (lines used as-is, without a "- " prefix)
+            return "\n".join([PROMPT_HEADER, "", *context, "<|user|>", query, "<|assistant|>", ""])
+    
+    def _decode_new_tokens(self, generated_tokens) -> str:
+        """Decode the tokens generated after the prompt into a response.
+        
+        Args:
+            generated_tokens: Token ids produced beyond the prompt
+            
+        Returns:
+            Decoded response with end markers stripped and corrupted output cleaned
+        """
+        return self._clean_decoded_text(self.tokenizer.decode(generated_tokens, skip_special_tokens=True))
+    
+    def _clean_decoded_text(self, text: str) -> str:
+        """Strip end markers from decoded model output and clean it if corrupted.
+        
+        Args:
+            text: Decoded generated text
+            
+        Returns:
+            Cleaned response
+        """
+        response = text.strip()
+        
+        # Only the new tokens are decoded, so the prompt never needs stripping. The
+        # prompt markers are plain text for most tokenizers, though, so
+        # skip_special_tokens keeps a role header the model echoed back. Only a leading
+        # header is stripped: a later one starts an over-generated turn, which
+        # _prevent_over_generation cuts together with the <|user|> line before it
+        if response.startswith("<|assistant|>"):
+            response = response[len("<|assistant|>"):].strip()
+        
+        # Remove end marker if present
+        response = response.partition("<|end_of_text|>")[0].strip()
+        
+        if response and self._check_output_corruption and self._is_corrupted_output(response):
+            logger.warning("Detected corrupted model output, applying cleanup")
+            return self._cleanup_response(response)
+        
+        return response
     
     def _extract_response(self, generated_text: str, prompt: str) -> str:
         """Extract response from the full generated text.
@@ -333,142 +1902,151 @@ class ModelManager:
         Returns:
             Extracted response
         """
-        # Check if we're using Llama-3 model
-        model_name = self.config.get('base_model', '').lower()
+        return self._response_extractor()(generated_text, prompt)
+    
+    def _response_extractor(self):
+        """Return the extraction routine for the configured model family.
+        
+        The choice depends only on `base_model`, so it is resolved once and
+        re-resolved only when the configured model name changes.
+        """
+        model_name = self.config.get('base_model', '')
+        if self._extractor_cache is not None and self._extractor_cache[0] == model_name:
+            return self._extractor_cache[1]
         
+        lowered = model_name.lower()
         # Checking if the model is damaged or 'abliterated' Llama-3
-        if "failspy" in model_name or "abliterated" in model_name:
-            # Special processing for damaged Llama-3 models
-            logger.warning("Detected problematic model output, applying special cleanup")
-            
-            # Improved answer extraction - try to extract answer using stronger pattern matching
-            if "<|assistant|>" in generated_text:
-                response = generated_text.split("<|assistant|>")[1].strip()
-                if "<|end_of_text|>" in response:
-                    response = response.split("<|end_of_text|>")[0].strip()
-            elif "Answer (as Lira):" in generated_text:
-                response = generated_text.split("Answer (as Juno):")[1].strip()
-            elif generated_text.startswith(prompt):
+        if "failspy" in lowered or "abliterated" in lowered:
+            extractor = self._extract_response_abliterated
+        elif "llama-3" in lowered:
+            extractor = self._extract_response_llama3
+        else:
+            extractor = self._extract_response_default
+        
+        self._extractor_cache = (model_name, extractor)
+        return extractor
+    
+    def _extract_response_abliterated(self, generated_text: str, prompt: str) -> str:
+        """Extract response for damaged or 'abliterated' Llama-3 models."""
+        # Special processing for damaged Llama-3 models
+        logger.warning("Detected problematic model output, applying special cleanup")
+        
+        # Improved answer extraction - try to extract answer using stronger pattern matching
+        assistant_text = _segment_after(generated_text, "<|assistant|>")
+        if assistant_text is not None:
+            response = assistant_text.strip().partition("<|end_of_text|>")[0].strip()
+        elif "Answer (as Lira):" in generated_text:
+            response = _segment_after(generated_text, "Answer (as Lira):").strip()
+        elif generated_text.startswith(prompt):
+            response = generated_text[len(prompt):].strip()
+        else:
+            # Fallback - try to find answer after the last occurrence of the query in the text
+            # This helps when the prompt is reformatted but query is still there
+            _, question_marker, last_question = prompt.rpartition("Question: ")
+            if question_marker:
+                user_query = last_question.partition("\n")[0].strip()
+                if user_query in generated_text:
+                    last_query_pos = generated_text.rfind(user_query)
+                    if last_query_pos >= 0:
+                        answer_start = last_query_pos + len(user_query)
+                        # Find next newline after the query
+                        next_nl = generated_text.find("\n", answer_start)
+                        if next_nl >= 0:
+                            response = generated_text[next_nl:].strip()
+                        else:
+                            response = generated_text[answer_start:].strip()
+                    else:
+                        response = generated_text
+                else:
+                    response = generated_text
+            else:
+                response = generated_text
+        
+        # Clean up garbage markers
+        return self._cleanup_response(response)
+    
+    def _extract_response_llama3(self, generated_text: str, prompt: str) -> str:
+        """Extract response for standard Llama-3 models."""
+        # For standard Llama-3, the response begins after <|assistant|>
+        assistant_text = _segment_after(generated_text, "<|assistant|>")
+        if assistant_text is not None:
+            # Remove end marker if present
+            response = assistant_text.strip().partition("<|end_of_text|>")[0].strip()
+        
+            # Check if the response contains garbage markers that need cleaning
+            if self._check_output_corruption and self._is_corrupted_output(response):
+                logger.warning("Detected corrupted output from Llama-3 model, applying cleanup")
+                return self._cleanup_response(response)
+        
+            return response
+        else:
+            # If we can't find the assistant marker, check for prompt patterns
+            answer_text = _segment_after(generated_text, "Answer (as Lira):")
+            if "Question: " in generated_text and answer_text is not None:
+                # Extract text after the answer marker
+                response = answer_text.strip()
+            else:
+                # If we can't find any markers, just remove the prompt
+                response = generated_text[len(prompt):].strip()
+        
+            # Check if the response needs cleaning
+            if self._check_output_corruption and self._is_corrupted_output(response):
+                logger.warning("Detected corrupted output from Llama-3 model, applying cleanup")
+                return self._cleanup_response(response)
+        
+            return response
+    
+    def _extract_response_default(self, generated_text: str, prompt: str) -> str:
+        """Extract response for other models using common answer patterns."""
+        # Standard response extraction for other models
+        # Try to find common answer patterns first
+        answer_text = _segment_after(generated_text, "Answer (as Lira):")
+        if answer_text is not None:
+            response = answer_text.strip()
+        else:
+            # If no answer marker found, try prompt removal
+            if generated_text.startswith(prompt):
                 response = generated_text[len(prompt):].strip()
             else:
-                # Fallback - try to find answer after the last occurrence of the query in the text
-                # This helps when the prompt is reformatted but query is still there
-                query_parts = prompt.split("Question: ")
-                if len(query_parts) > 1:
-                    user_query = query_parts[-1].split("\n")[0].strip()
+                # Try to extract response after the query
+                _, question_marker, last_question = prompt.rpartition("Question: ")
+                if question_marker:
+                    user_query = last_question.partition("\n")[0].strip()
                     if user_query in generated_text:
                         last_query_pos = generated_text.rfind(user_query)
                         if last_query_pos >= 0:
                             answer_start = last_query_pos + len(user_query)
-                            # Find next newline after the query
+                            # Look for "Answer", newline, or just use everything after query
+                            answer_marker = generated_text.find("Answer", answer_start)
                             next_nl = generated_text.find("\n", answer_start)
-                            if next_nl >= 0:
+                            if answer_marker >= 0:
+                                response = generated_text[answer_marker:].strip()
+                                # If there's "Answer (as Lira):" extract what follows
+                                answer_text = _segment_after(response, "Answer (as Lira):")
+                                if answer_text is not None:
+                                    response = answer_text.strip()
+                            elif next_nl >= 0:
                                 response = generated_text[next_nl:].strip()
                             else:
                                 response = generated_text[answer_start:].strip()
                         else:
+                            # If we can't find the query, log a warning and return raw output
+                            logger.warning("Failed to extract response by query matching")
                             response = generated_text
                     else:
+                        logger.warning("Query not found in generated text")
                         response = generated_text
                 else:
+                    # No clear way to extract response, log a warning
+                    logger.warning("No reliable markers to extract response, may contain prompt")
                     response = generated_text
-            
-            # Clean up garbage markers
+        
+        # Check if the response needs cleaning
+        if self._check_output_corruption and self._is_corrupted_output(response):
+            logger.warning("Detected corrupted output, applying cleanup")
             return self._cleanup_response(response)
-            
-        elif "llama-3" in model_name:
-            # For standard Llama-3, the response begins after <|assistant|>
-            if "<|assistant|>" in generated_text:
-                response = generated_text.split("<|assistant|>")[1].strip()
-                
-                # Remove end marker if present
-                if "<|end_of_text|>" in response:
-                    response = response.split("<|end_of_text|>")[0].strip()
-                
-                # Check if the response contains garbage markers that need cleaning
-                if self._is_corrupted_output(response):
-                    logger.warning("Detected corrupted output from Llama-3 model, applying cleanup")
-                    return self._cleanup_response(response)
-                
-                return response
-            else:
-                # If we can't find the assistant marker, check for prompt patterns
-                if "Question: " in generated_text and "Answer (as Lira):" in generated_text:
-                    # Try to extract text after the answer marker
-                    parts = generated_text.split("Answer (as Lira):")
-                    if len(parts) > 1:
-                        response = parts[1].strip()
-                    else:
-                        # If splitting somehow failed, use the default approach
-                        response = generated_text[len(prompt):].strip()
-                else:
-                    # If we can't find any markers, just remove the prompt
-                    response = generated_text[len(prompt):].strip()
-                
-                # Check if the response needs cleaning
-                if self._is_corrupted_output(response):
-                    logger.warning("Detected corrupted output from Llama-3 model, applying cleanup")
-                    return self._cleanup_response(response)
-                
-                return response
-        else:
-            # Standard response extraction for other models
-            # Try to find common answer patterns first
-            if "Answer (as Lira):" in generated_text:
-                parts = generated_text.split("Answer (as Lira):")
-                if len(parts) > 1:
-                    response = parts[1].strip()
-                else:
-                    # If splitting somehow failed, use prompt removal
-                    if generated_text.startswith(prompt):
-                        response = generated_text[len(prompt):].strip()
-                    else:
-                        # Last resort - return raw output, but log a warning
-                        logger.warning("Could not reliably extract model response, may contain prompt text")
-                        response = generated_text
-            else:
-                # If no answer marker found, try prompt removal
-                if generated_text.startswith(prompt):
-                    response = generated_text[len(prompt):].strip()
-                else:
-                    # Try to extract response after the query
-                    query_parts = prompt.split("Question: ")
-                    if len(query_parts) > 1:
-                        user_query = query_parts[-1].split("\n")[0].strip()
-                        if user_query in generated_text:
-                            last_query_pos = generated_text.rfind(user_query)
-                            if last_query_pos >= 0:
-                                answer_start = last_query_pos + len(user_query)
-                                # Look for "Answer", newline, or just use everything after query
-                                answer_marker = generated_text.find("Answer", answer_start)
-                                next_nl = generated_text.find("\n", answer_start)
-                                if answer_marker >= 0:
-                                    response = generated_text[answer_marker:].strip()
-                                    # If there's "Answer (as Lira):" extract what follows
-                                    if "Answer (as Lira):" in response:
-                                        response = response.split("Answer (as Lira):")[1].strip()
-                                elif next_nl >= 0:
-                                    response = generated_text[next_nl:].strip()
-                                else:
-                                    response = generated_text[answer_start:].strip()
-                            else:
-                                # If we can't find the query, log a warning and return raw output
-                                logger.warning("Failed to extract response by query matching")
-                                response = generated_text
-                        else:
-                            logger.warning("Query not found in generated text")
-                            response = generated_text
-                    else:
-                        # No clear way to extract response, log a warning
-                        logger.warning("No reliable markers to extract response, may contain prompt")
-                        response = generated_text
-                
-            # Check if the response needs cleaning
-            if self._is_corrupted_output(response):
-                logger.warning("Detected corrupted output, applying cleanup")
-                return self._cleanup_response(response)
-                
-            return response
+        
+        return response
     
     def _is_corrupted_output(self, text: str) -> bool:
         """Check if the model output contains garbage markers that need cleaning.
@@ -479,61 +2057,17 @@ class ModelManager:
         Returns:
             True if the text needs cleaning, False otherwise
         """
-        import re
-        
-        # List of patterns identifying corrupted output
-        corruption_patterns = [
-            # Nested code markers or tags
-            r'```[^`]*```',
-            r'`{3,}',
-            # HTML/XML style tags
-            r'</?[A-Za-z]+/?>',
-            # Nested parentheses with paths
-            r'/[A-Za-z/_.]+/',
-            # Multiple parentheses, braces, etc.
-            r'[\)\}\(\{\[\]]{3,}',
-            # Markers like (Lira:)
-            r'\([A-Za-z]+:?\)',
-            # Lines containing mainly invalid characters
-            r'\|+\s*\|+',
-            # Specific markers from damaged models
-            r'=====',
-            r'\(/+\)',
-            r'\(\*\)',
-            r'/LIRA/',
-            # Additional patterns detected in logs
-            r'```\n\n```',
-            r'\(\*\)\s*\(\*\)',
-            r'\(\s*\`\s*```\)',
-            r'\s*/\)\s*```',
-            r'}\s*}\s*}',
-            r'\*\*\*\.\*\*\*',
-            r'<[/]?lira[/]?>',
-            r'<[/]?assistant[/]?>',
-            r'\(\.\*\.\*\.\)',
-            r'[a-zA-Z]+[/][a-zA-Z]+[/][a-zA-Z]+',
-            r'\("`"\)',
-            r'\.{3,}',
-            r'\("`"\)',
-            r'\("```\)',
-            r'/usr/local/bin',
-            r'<\w+/>'
-        ]
-        
         # Check for pattern occurrences in the text
-        for pattern in corruption_patterns:
-            if re.search(pattern, text):
-                return True
+        if _contains_corruption_pattern(text):
+            return True
         
-        # Check the proportion of special characters to the entire text
-        special_chars = len(re.findall(r'[^\w\s]', text))
         total_length = len(text)
+        if total_length == 0:
+            return False
         
-        # If the proportion of special characters is too high, the text needs cleaning
-        if total_length > 0 and special_chars / total_length > 0.25:
-            return True
-        
-        return False
+        # If the proportion of special characters is too high, the text needs cleaning;
+        # this also catches short outputs such as "====" that no pattern matches
+        return count_special_chars(text) > total_length * 0.25
     
     def _cleanup_response(self, text: str) -> str:
         """Clean response from damaged models by removing garbage markers.
@@ -569,63 +2103,30 @@ class ModelManager:
         """
         if not response:
             return response
-            
-        # Patterns that indicate the model is impersonating Tata/Jarek
-        impersonation_patterns = [
-            r'\btata\s*:',           # "Tata:" or "tata:"
-            r'\bjarek\s*:',          # "Jarek:" or "jarek:"
-            r'\btato\s*:',           # "Tato:" - vocative form
-            r'<\|user\|>',           # User token
-            r'\buser\s*:',           # "User:"
-            r'\b[Tt]ata\s+mówi',     # "Tata mówi" or "tata mówi"
-            r'\b[Jj]arek\s+mówi',    # "Jarek mówi" or "jarek mówi"
-            r'\b[Tt]ata\s+odpowiada', # "Tata odpowiada"
-            r'\b[Jj]arek\s+odpowiada' # "Jarek odpowiada"
-        ]
-        
-        # Split response into lines for analysis
-        lines = response.split('\n')
-        safe_lines = []
-        
-        for line in lines:
-            # Check if this line contains impersonation
-            line_lower = line.lower()
-            found_impersonation = False
-            
-            for pattern in impersonation_patterns:
-                if re.search(pattern, line, re.IGNORECASE):
-                    logger.warning(f"Detected impersonation pattern in response: {pattern}")
-                    found_impersonation = True
-                    break
-            
-            if found_impersonation:
-                # Stop here - don't include this line or any following lines
-                break
-                
-            safe_lines.append(line)
         
-        # Rejoin the safe lines
-        result = '\n'.join(safe_lines).strip()
+        # Cut off everything from the earliest impersonation pattern onwards, whether
+        # it starts a line or is a dialogue attribution within a sentence. The common
+        # case without a pattern is settled by a single scan
+        match = _IMPERSONATION_RE.search(response) if _contains_impersonation_pattern(response) else None
+        if match is None:
+            return response.strip()
         
-        # Final check: if the response contains any form of dialogue attribution to Tata/Jarek
-        # even within sentences, cut it off
-        for pattern in impersonation_patterns:
-            match = re.search(pattern, result, re.IGNORECASE)
-            if match:
-                # Cut off everything from the impersonation pattern onwards
-                result = result[:match.start()].strip()
-                logger.warning(f"Cut off response at impersonation pattern: {pattern}")
-                break
-        
-        return result
+        # Name the pattern that matched there
+        pattern = next(pattern for pattern in _IMPERSONATION_RES if pattern.match(response, match.start()))
+        logger.warning(f"Cut off response at impersonation pattern: {pattern.pattern}")
+        return response[:match.start()].strip()
     
-    def _ensure_sentence_completion(self, response: str, original_input_ids: torch.Tensor, gen_kwargs: dict) -> str:
+    def _ensure_sentence_completion(self, response: str, original_input_ids: torch.Tensor, gen_kwargs: dict,
+                                    continuation: Optional[tuple] = None) -> str:
         """Ensure response ends at a natural sentence boundary.
         
         Args:
             response: Generated response that might be cut off
-            original_input_ids: Original input token IDs
+            original_input_ids: Prompt token IDs, without padding
             gen_kwargs: Generation kwargs used
+            continuation: Optional (sequences, past_key_values) of the generation that
+                produced the response; completion then only decodes new tokens instead
+                of re-encoding and prefilling the prompt and the response
             
         Returns:
             Response completed to sentence boundary if needed
@@ -635,7 +2136,7 @@ class ModelManager:
             
         # Check if response ends mid-sentence (no proper punctuation)
         last_char = response.rstrip()[-1] if response.rstrip() else ""
-        sentence_endings = ['.', '!', '?', ':', ';']
+        sentence_endings = SENTENCE_ENDINGS
         
         # If it already ends properly, return as-is
         if last_char in sentence_endings:
@@ -651,33 +2152,59 @@ class ModelManager:
         
         try:
             # Try to complete the sentence with a small additional generation
-            # Reconstruct full prompt with current response
-            full_prompt_with_response = self._reconstruct_prompt_with_response(original_input_ids, response)
-            
-            # Small additional generation to complete the sentence
-            completion_input_ids = self.tokenizer.encode(full_prompt_with_response, return_tensors="pt").to(self.model.device)
+            if continuation is not None:
+                # Only the last generated token is not in the cache yet
+                completion_input_ids, past_key_values = continuation
+                cache_kwargs = {
+                    "past_key_values": past_key_values,
+                    "attention_mask": completion_input_ids.new_ones(completion_input_ids.shape)
+                }
+            else:
+                # Append the response to the prompt ids; only the response is tokenized,
+                # the prompt is neither decoded nor encoded again
+                response_ids = self.tokenizer.encode(response, add_special_tokens=False, return_tensors="pt")
+                completion_input_ids = torch.cat(
+                    [original_input_ids, response_ids.to(original_input_ids.device)], dim=1
+                )
+                cache_kwargs = {}
             
             # Use very limited generation for completion
             completion_kwargs = gen_kwargs.copy()
             max_completion_tokens = self.config.get('sentence_completion_max_tokens', 20)
+            # The prompt plus the response may already fill the context window
+            if self._model_context_length is not None:
+                max_completion_tokens = min(
+                    max_completion_tokens, self._model_context_length - completion_input_ids.shape[1]
+                )
+                if max_completion_tokens <= 0:
+                    logger.debug("No room left in the context window for completion, adding period")
+                    return response.rstrip() + "."
             completion_kwargs["max_new_tokens"] = max_completion_tokens
             completion_kwargs["do_sample"] = False  # Use greedy for completion
-            completion_kwargs["temperature"] = 0.3  # Low temperature for stable completion
-            completion_kwargs["top_p"] = 0.7  # More focused completion
+            # Sampling parameters have no effect on greedy decoding
+            for key in SAMPLING_PARAMS:
+                completion_kwargs.pop(key, None)
+            # Only the text up to the first sentence ending is kept, so generation can
+            # stop at a sentence-ending token. min_length would suppress these tokens
+            if self._sentence_end_token_ids and "min_length" not in completion_kwargs:
+                eos_token_id = completion_kwargs.get("eos_token_id")
+                if eos_token_id is None:
+                    eos_token_id = []
+                elif isinstance(eos_token_id, int):
+                    eos_token_id = [eos_token_id]
+                completion_kwargs["eos_token_id"] = list(eos_token_id) + self._sentence_end_token_ids
             
-            with torch.no_grad():
+            with torch.inference_mode(), self._autocast():
                 completion_outputs = self.model.generate(
                     completion_input_ids,
-                    **completion_kwargs
+                    **completion_kwargs,
+                    **cache_kwargs
                 )
             
-            # Decode the completion
-            full_completion = self.tokenizer.decode(completion_outputs[0], skip_special_tokens=True)
-            
-            # Extract only the new part (after the original response)
-            original_length = len(full_prompt_with_response)
-            if len(full_completion) > original_length:
-                additional_text = full_completion[original_length:].strip()
+            # Decode only the new tokens (after the original response)
+            completion_tokens = completion_outputs[0][completion_input_ids.shape[1]:]
+            additional_text = self.tokenizer.decode(completion_tokens, skip_special_tokens=True).strip()
+            if additional_text:
                 
                 # Find the first sentence ending in the additional text
                 completion_end = -1
@@ -716,23 +2243,3 @@ class ModelManager:
             if response.rstrip() and response.rstrip()[-1] not in sentence_endings:
                 return response.rstrip() + "."
             return response
-    
-    def _reconstruct_prompt_with_response(self, original_input_ids: torch.Tensor, response: str) -> str:
-        """Reconstruct the full prompt with the generated response for continuation.
-        
-        Args:
-            original_input_ids: Original input token IDs
-            response: Generated response so far
-            
-        Returns:
-            Full text for continuation
-        """
-        try:
-            # Decode original prompt
-            original_prompt = self.tokenizer.decode(original_input_ids[0], skip_special_tokens=True)
-            # Combine with response
-            return original_prompt + response
-        except Exception as e:
-            logger.warning(f"Error reconstructing prompt: {e}")
-            # Fallback: just return response (will be less accurate but won't crash)
-            return response
@@ -4,7 +4,10 @@ import pytest
 from unittest.mock import MagicMock, patch
 import re
 
-from src.modules.model.model_manager import ModelManager
+from src.modules.model.model_manager import (
+    ModelManager, _CORRUPTION_RE, _IMPERSONATION_RE, _contains_corruption_pattern, _contains_impersonation_pattern
+)
+from src.utils.text_cleanup import count_special_chars
 
 
 @pytest.fixture
@@ -194,6 +197,7 @@ def test_generate_response_with_cleanup(model_manager):
     # Mock generate to return a corrupted response
     encode_return = MagicMock()
     encode_return.to.return_value = encode_return
+    encode_return.shape = (1, 3)
     model_manager.tokenizer.encode.return_value = encode_return
     model_manager.tokenizer.decode.return_value = "This is ```}}}```/lira/ a corrupted response."
     
@@ -202,4 +206,113 @@ def test_generate_response_with_cleanup(model_manager):
         with patch.object(model_manager, '_cleanup_response', return_value="This is a cleaned response."):
             # Test generation with cleanup
             response = model_manager.generate_response("Test query")
-            assert response == "This is a cleaned response."
\ No newline at end of file
+            assert response == "This is a cleaned response."
+
+@pytest.mark.pikachu(name="test_corruption_check_disabled", description="Test skipping the corruption check")
+def test_corruption_check_disabled(model_config):
+    """Test that the corruption scan is skipped when disabled in the config."""
+    model_config["check_output_corruption"] = False
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    
+    with patch.object(manager, '_is_corrupted_output', return_value=True) as mock_check:
+        response = manager._clean_decoded_text("This is ```}}}``` a response.<|end_of_text|>")
+    
+    mock_check.assert_not_called()
+    assert response == "This is ```}}}``` a response."
+
+
+@pytest.mark.pikachu(name="test_corruption_scan_engines", description="Test Hyperscan and re corruption scans agree")
+def test_corruption_scan_matches_regex():
+    """Test that the Hyperscan corruption scan gives the same result as the fused regex."""
+    pytest.importorskip("hyperscan")
+    samples = [
+        "This is a normal response with no corruption.",
+        "Cześć tato, jak się dzisiaj czujesz? Żółć i gęślą jaźń.",
+        "Temperatura wynosi 25°C… a potem 30°C",
+        "Emoji 😊 w odpowiedzi (Lira:) też",
+        "```\nHello\n```",
+        "<lira>Hello</lira>",
+        "/usr/local/bin/lira",
+        "Something }}}}",
+        "| | | | | |",
+        "Wait... what?",
+        "a/b/c",
+        "ąę/ść/źż",
+        "|\x1c|",
+        "",
+    ]
+    for text in samples:
+        assert _contains_corruption_pattern(text) == (_CORRUPTION_RE.search(text) is not None), text
+
+
+@pytest.mark.pikachu(name="test_impersonation_scan_engines", description="Test Hyperscan and re impersonation scans agree")
+def test_impersonation_scan_matches_regex():
+    """Test that the Hyperscan impersonation scan gives the same result as the fused regex."""
+    pytest.importorskip("hyperscan")
+    samples = [
+        "Tata: how are you?",
+        "I told my dad (tata) about it.",
+        "Then Jarek odpowiada that he is fine",
+        "JAREK MÓWI coś ważnego",
+        "User:",
+        "user\x1c:",
+        "superuser: not a match",
+        "<|user|>",
+        "tatay: no boundary",
+        "\u212aarek: Kelvin sign",
+        "",
+    ]
+    for text in samples:
+        assert _contains_impersonation_pattern(text) == (_IMPERSONATION_RE.search(text) is not None), text
+
+
+@pytest.mark.pikachu(name="test_abliterated_answer_marker", description="Test abliterated answer marker extraction")
+def test_extract_response_abliterated_answer_marker(model_manager):
+    """Test extracting the answer after the Lira answer marker from an abliterated model."""
+    with patch.dict(model_manager.config, {"base_model": "failspy/llama-3-abliterated"}):
+        generated = "Question: How are you?\nAnswer (as Lira): I am doing well, thank you for asking."
+        response = model_manager._extract_response(generated, "any prompt")
+        assert response == "I am doing well, thank you for asking."
+
+
+@pytest.mark.pikachu(name="test_decoded_echoed_role_header", description="Test stripping an echoed assistant header")
+def test_clean_decoded_text_echoed_assistant_header(model_manager):
+    """Test that an assistant header echoed in the generated tokens is stripped."""
+    response = model_manager._clean_decoded_text("<|assistant|>\nHello, how can I help you today?<|end_of_text|>")
+    assert response == "Hello, how can I help you today?"
+
+
+@pytest.mark.pikachu(name="test_decoded_extra_turn", description="Test keeping the first turn of an over-generated response")
+def test_clean_decoded_text_keeps_first_turn(model_manager):
+    """Test that a trailing over-generated turn does not replace the actual answer."""
+    text = "Sure, here is my answer.\n<|user|>\nThanks!\n<|assistant|>\nYou're welcome, Tata."
+    response = model_manager._clean_decoded_text(text)
+    assert response.startswith("Sure, here is my answer.")
+    assert model_manager._prevent_over_generation(response) == "Sure, here is my answer."
+
+
+@pytest.mark.pikachu(name="test_over_generation_single_scan", description="Test the over-generation check without impersonation")
+def test_prevent_over_generation_without_impersonation(model_manager):
+    """Test that a response without impersonation is only stripped, and a pattern across lines is still cut."""
+    assert model_manager._prevent_over_generation("  First line.\nSecond line.\n") == "First line.\nSecond line."
+    assert model_manager._prevent_over_generation("All good.\nTata\n: what next?") == "All good."
+
+
+@pytest.mark.pikachu(name="test_over_generation_earliest_match", description="Test cutting at the earliest impersonation pattern")
+def test_prevent_over_generation_cuts_at_earliest_match(model_manager):
+    """Test that the response is cut where the earliest impersonation pattern starts."""
+    assert model_manager._prevent_over_generation("Sure, I can help.\nTata: thanks!") == "Sure, I can help."
+    # Text before the pattern on the same line is kept
+    assert model_manager._prevent_over_generation("Hello there.\nOK. User: next question") == "Hello there.\nOK."
+    # The earliest pattern wins over the order of IMPERSONATION_PATTERNS
+    assert model_manager._prevent_over_generation("Answer. Jarek mówi coś. Tata: hej") == "Answer."
+
+
+@pytest.mark.pikachu(name="test_count_special_chars_long_text", description="Test counting special characters in long non-ASCII text")
+def test_count_special_chars_long_non_ascii_text():
+    """Test that the vectorized count of long non-ASCII text matches the regex count."""
+    text = "Zażółć gęślą jaźń — to „przykład”… 😀 ok?\n" * 20
+    assert count_special_chars(text) == len(re.findall(r'[^\w\s]', text))
+    assert count_special_chars(text[:40]) == len(re.findall(r'[^\w\s]', text[:40]))
@@ -3,7 +3,9 @@
 import pytest
 from unittest.mock import MagicMock, patch
 
-from src.modules.model.model_manager import ModelManager
+from src.modules.model.model_manager import (
+    GENERATION_ERROR_RESPONSE, ModelManager, _InteractionRecord, _dumps_log_record
+)
 
 
 @pytest.fixture
@@ -47,6 +49,7 @@ def test_generate_response(model_config, mock_model):
             manager.model = mock_model
             encode_return = MagicMock()
             encode_return.to.return_value = encode_return
+            encode_return.shape = (1, 3)
             manager.tokenizer = MagicMock()
             manager.tokenizer.encode.return_value = encode_return
             manager.tokenizer.decode.return_value = "To jest testowa odpowiedź."
@@ -71,6 +74,7 @@ def test_generate_response_with_context(model_config, mock_model):
             manager.model = mock_model
             encode_return = MagicMock()
             encode_return.to.return_value = encode_return
+            encode_return.shape = (1, 3)
             manager.tokenizer = MagicMock()
             manager.tokenizer.encode.return_value = encode_return
             manager.tokenizer.decode.return_value = "To jest testowa odpowiedź z kontekstem."
@@ -85,3 +89,966 @@ def test_generate_response_with_context(model_config, mock_model):
     assert len(response) > 0
     # Sprawdź, czy mock modelu został wywołany
     mock_model.generate.assert_called_once()
+
+
+def test_generate_response_cache(model_config, mock_model):
+    """Test ponownego użycia odpowiedzi dla deterministycznego generowania."""
+    model_config["do_sample"] = False
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+            manager.model = mock_model
+            encode_return = MagicMock()
+            encode_return.to.return_value = encode_return
+            encode_return.shape = (1, 3)
+            manager.tokenizer = MagicMock()
+            manager.tokenizer.encode.return_value = encode_return
+            manager.tokenizer.decode.return_value = "To jest testowa odpowiedź."
+            
+            first = manager.generate_response("Testowe zapytanie", [])
+            second = manager.generate_response("Testowe zapytanie", [])
+            
+            # Druga odpowiedź pochodzi z pamięci podręcznej
+            assert first == second
+            mock_model.generate.assert_called_once()
+            
+            # Po wyczyszczeniu pamięci podręcznej model jest wywoływany ponownie
+            manager.clear_response_cache()
+            manager.generate_response("Testowe zapytanie", [])
+            assert mock_model.generate.call_count == 2
+
+
+def test_generate_responses_batch(model_config):
+    """Test generowania odpowiedzi dla wielu zapytań jednym wywołaniem modelu."""
+    import torch
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+            manager.model = MagicMock()
+            manager.model.device = "cpu"
+            manager.tokenizer = MagicMock()
+            manager.tokenizer.return_value = {
+                "input_ids": torch.tensor([[0, 5, 6], [7, 8, 9]]),
+                "attention_mask": torch.tensor([[0, 1, 1], [1, 1, 1]])
+            }
+            manager.model.generate.return_value = torch.tensor([[0, 5, 6, 10, 11], [7, 8, 9, 12, 13]])
+            manager.tokenizer.decode.side_effect = lambda ids, skip_special_tokens: f"Odpowiedź {ids.tolist()}"
+            
+            responses = manager.generate_responses_batch(["Pierwsze", "Drugie"], [[], ["Kontekst"]])
+    
+    # Model wywołany raz dla całej partii, dekodowane są tylko nowe tokeny
+    manager.model.generate.assert_called_once()
+    assert "attention_mask" in manager.model.generate.call_args.kwargs
+    assert responses == ["Odpowiedź [10, 11]", "Odpowiedź [12, 13]"]
+
+
+class CharTokenizer:
+    """Prosty tokenizer znakowy do testów kodowania promptu."""
+    
+    eos_token_id = 0
+    pad_token = "<pad>"
+    
+    def __init__(self):
+        self.encoded_texts = []
+    
+    def encode(self, text, add_special_tokens=True, return_tensors=None):
+        self.encoded_texts.append(text)
+        ids = ([1] if add_special_tokens else []) + [ord(c) for c in text]
+        if return_tensors == "pt":
+            import torch
+            return torch.tensor([ids])
+        return ids
+    
+    def __call__(self, texts, add_special_tokens=True):
+        return {"input_ids": [self.encode(text, add_special_tokens=add_special_tokens) for text in texts]}
+
+
+def test_prompt_prefix_cache(model_config):
+    """Test ponownego użycia zakodowanego prefiksu promptu."""
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer") as mock_tokenizer_cls:
+            tokenizer = CharTokenizer()
+            mock_tokenizer_cls.from_pretrained.return_value = tokenizer
+            mock_model_cls.from_pretrained.return_value.device = "cpu"
+            manager = ModelManager(model_config)
+    
+    assert manager._prompt_prefix_ids == tokenizer.encode(manager._prompt_prefix)
+    
+    # Kodowany jest tylko dynamiczny fragment promptu, a wynik jest identyczny
+    prompt = manager._prepare_prompt("Testowe zapytanie", ["Kontekst"])
+    tokenizer.encoded_texts.clear()
+    input_ids = manager._encode_prompt(prompt)
+    
+    assert input_ids[0].tolist() == tokenizer.encode(prompt)
+    assert tokenizer.encoded_texts[0] == prompt[len(manager._prompt_prefix):]
+    
+    # Partia promptów jest dopełniana z lewej strony, z zapamiętanym prefiksem w każdym wierszu
+    prompts = [manager._prepare_prompt("Krótkie", None), prompt]
+    batch_ids, attention_mask = manager._encode_prompt_batch(prompts)
+    short_ids = tokenizer.encode(prompts[0])
+    padding = batch_ids.shape[1] - len(short_ids)
+    assert batch_ids[0, padding:].tolist() == short_ids
+    assert attention_mask[0].tolist() == [0] * padding + [1] * len(short_ids)
+    assert batch_ids[1].tolist() == tokenizer.encode(prompt)
+    assert attention_mask[1].all()
+
+
+def test_persona_prompt_prefix_cache(model_config):
+    """Test ponownego użycia zakodowanego nagłówka promptu z opisem persony."""
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer") as mock_tokenizer_cls:
+            tokenizer = CharTokenizer()
+            mock_tokenizer_cls.from_pretrained.return_value = tokenizer
+            mock_model_cls.from_pretrained.return_value.device = "cpu"
+            manager = ModelManager(model_config)
+    
+    context = ["You are Skynet, a curious assistant.", "Wspomnienie"]
+    prompt = manager._prepare_prompt("Testowe zapytanie", context)
+    assert manager._encode_prompt(prompt, context)[0].tolist() == tokenizer.encode(prompt)
+    
+    # Przy kolejnym zapytaniu z tą samą personą kodowany jest tylko fragment po niej
+    prompt = manager._prepare_prompt("Drugie zapytanie", context)
+    tokenizer.encoded_texts.clear()
+    input_ids = manager._encode_prompt(prompt, context)
+    
+    assert input_ids[0].tolist() == tokenizer.encode(prompt)
+    assert tokenizer.encoded_texts[0] == prompt.partition(context[0])[2]
+    assert len(manager._persona_prefix_ids) == 1
+    
+    # Kontekst bez persony korzysta tylko z prefiksu systemowego
+    assert manager._prompt_token_ids(prompt, ["Wspomnienie"]) == tokenizer.encode(prompt)
+    assert len(manager._persona_prefix_ids) == 1
+
+
+def test_prompt_without_duplicate_bos(model_config):
+    """Test kodowania promptu bez drugiego tokenu BOS, gdy nagłówek promptu jest tokenem BOS."""
+    class BosTokenizer(CharTokenizer):
+        bos_token = "<|begin_of_text|>"
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer") as mock_tokenizer_cls:
+            mock_tokenizer_cls.from_pretrained.return_value = BosTokenizer()
+            mock_model_cls.from_pretrained.return_value.device = "cpu"
+            manager = ModelManager(model_config)
+    
+    prompt = manager._prepare_prompt("Testowe zapytanie", ["Kontekst"])
+    assert manager._prompt_token_ids(prompt) == [ord(c) for c in prompt]
+    assert manager._encode_prompt(prompt)[0].tolist() == [ord(c) for c in prompt]
+    
+    # Tokenizer z innym tokenem BOS nadal go dodaje
+    manager.tokenizer.bos_token = "<s>"
+    manager._init_generation_defaults()
+    manager._init_prompt_prefix_cache()
+    assert manager._prompt_token_ids(prompt) == [1] + [ord(c) for c in prompt]
+
+
+def test_pad_to_bucket(model_config):
+    """Test dopełniania promptu do długości kubełka dla skompilowanego modelu."""
+    import torch
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    manager.tokenizer = MagicMock()
+    manager.tokenizer.pad_token_id = 0
+    
+    # Bez CUDA i bez flagi compile_model model nie jest kompilowany
+    assert manager._model_compiled is False
+    
+    input_ids = torch.arange(1, 71).unsqueeze(0)
+    attention_mask = torch.ones_like(input_ids)
+    padded_ids, padded_mask = manager._pad_to_bucket(input_ids, attention_mask)
+    
+    # Dopełnienie z lewej strony do 128 tokenów, zamaskowane w attention_mask
+    assert padded_ids.shape == (1, 128)
+    assert padded_ids[0, :58].tolist() == [0] * 58
+    assert padded_ids[0, 58:].tolist() == input_ids[0].tolist()
+    assert padded_mask[0].sum().item() == 70
+    
+    # Prompt dłuższy niż największy kubełek pozostaje bez zmian
+    long_ids = torch.ones((1, 3000), dtype=torch.long)
+    same_ids, _ = manager._pad_to_bucket(long_ids, torch.ones_like(long_ids))
+    assert same_ids is long_ids
+
+
+def test_encode_generation_inputs_pads_on_host(model_config):
+    """Test dopełniania promptu przed kopiowaniem na urządzenie dla skompilowanego modelu."""
+    import torch
+
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    manager.model.device = "cpu"
+    manager.tokenizer = MagicMock()
+    manager.tokenizer.pad_token_id = 0
+    manager.tokenizer.encode.side_effect = lambda text, return_tensors=None, **kwargs: (
+        torch.arange(1, 71).unsqueeze(0) if return_tensors == "pt" else list(range(1, 71))
+    )
+    manager._prompt_prefix_ids = []
+
+    # Model nieskompilowany: bez dopełnienia, pełna maska
+    input_ids, attention_mask = manager._encode_generation_inputs("prompt")
+    assert input_ids.shape == (1, 70)
+    assert attention_mask.all()
+
+    # Model skompilowany: ten sam wynik co _pad_to_bucket
+    manager._model_compiled = True
+    input_ids, attention_mask = manager._encode_generation_inputs("prompt")
+    unpadded = torch.arange(1, 71).unsqueeze(0)
+    expected_ids, expected_mask = manager._pad_to_bucket(unpadded, torch.ones_like(unpadded))
+    assert torch.equal(input_ids, expected_ids)
+    assert torch.equal(attention_mask, expected_mask)
+
+
+def test_compiled_prompt_bucket_leaves_room_in_context(model_config):
+    """Test generowania dla skompilowanego modelu, gdy kubełek promptu nie mieści się w kontekście."""
+    import torch
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer") as mock_tokenizer_cls:
+            mock_tokenizer_cls.from_pretrained.return_value = CharTokenizer()
+            mock_model_cls.from_pretrained.return_value.device = "cpu"
+            mock_model_cls.from_pretrained.return_value.config.max_position_embeddings = 2048
+            manager = ModelManager(model_config)
+    manager.tokenizer.pad_token_id = 0
+    manager.tokenizer.decode = lambda ids, skip_special_tokens=True: "".join(chr(i) for i in ids)
+    answer = "To jest pełna odpowiedź modelu."
+    manager.model.generate.side_effect = lambda input_ids, **kwargs: torch.cat(
+        [input_ids, torch.tensor([[ord(c) for c in answer]])], dim=1
+    )
+    manager._model_compiled = True
+    
+    # Prompt między 1025 a 2047 tokenami nie jest dopełniany do kubełka 2048
+    response = manager.generate_response("a" * 1000)
+    input_ids = manager.model.generate.call_args.args[0]
+    assert 1024 < input_ids.shape[1] < 2048
+    assert manager.model.generate.call_args.kwargs["max_new_tokens"] == model_config.get("max_new_tokens", 150)
+    assert response == answer
+    
+    # Krótszy prompt nadal jest dopełniany do kubełka, o ile zostaje miejsce na nowe tokeny
+    assert manager._bucket_length(600) == 1024
+    assert manager._bucket_length(1000) == 1024
+    manager.config["max_new_tokens"] = 1100
+    assert manager._bucket_length(1000) == 1000
+
+
+def test_generate_response_with_assistant_model(model_config, mock_model):
+    """Test przekazania modelu pomocniczego przy generowaniu deterministycznym."""
+    model_config["assistant_model"] = "test/draft-model"
+    model_config["do_sample"] = False
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    
+    # Model pomocniczy jest wczytywany obok modelu bazowego
+    assert mock_model_cls.from_pretrained.call_args_list[-1][0][0] == "test/draft-model"
+    assert manager.assistant_model is mock_model_cls.from_pretrained.return_value
+    
+    manager.model = mock_model
+    encode_return = MagicMock()
+    encode_return.to.return_value = encode_return
+    encode_return.shape = (1, 3)
+    manager.tokenizer = MagicMock()
+    manager.tokenizer.encode.return_value = encode_return
+    manager.tokenizer.decode.return_value = "To jest testowa odpowiedź."
+    
+    manager.generate_response("Testowe zapytanie")
+    
+    assert mock_model.generate.call_args[1]["assistant_model"] is manager.assistant_model
+
+
+def test_torch_dtype_config(model_config):
+    """Test ustawienia typu obliczeń dla kwantyzacji 4-bitowej z konfiguracji."""
+    import torch
+    
+    model_config["torch_dtype"] = "bfloat16"
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            with patch("src.modules.model.model_manager.BitsAndBytesConfig") as mock_bnb_config:
+                ModelManager(model_config)
+    
+    assert mock_bnb_config.call_args.kwargs["bnb_4bit_compute_dtype"] == torch.bfloat16
+    
+    # Nieznany typ jest zgłaszany przed wczytaniem modelu
+    model_config["torch_dtype"] = "int3"
+    with pytest.raises(ValueError):
+        ModelManager(model_config)
+
+
+def test_flash_attention_fallback(model_config):
+    """Test powrotu do atencji sdpa, gdy model nie obsługuje FlashAttention-2."""
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            with patch.object(ModelManager, "_select_attn_implementation", return_value="flash_attention_2"):
+                mock_model_cls.from_pretrained.side_effect = [
+                    ValueError("LlamaForCausalLM does not support Flash Attention 2.0 yet."), MagicMock()
+                ]
+                ModelManager(model_config)
+    
+    attn_implementations = [call.kwargs["attn_implementation"] for call in mock_model_cls.from_pretrained.call_args_list]
+    assert attn_implementations == ["flash_attention_2", "sdpa"]
+
+
+def test_sdpa_attention_fallback(model_config):
+    """Test powrotu do atencji eager, gdy model nie obsługuje ani FlashAttention-2, ani sdpa."""
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            with patch.object(ModelManager, "_select_attn_implementation", return_value="flash_attention_2"):
+                mock_model_cls.from_pretrained.side_effect = [
+                    ValueError("LlamaForCausalLM does not support Flash Attention 2.0 yet."),
+                    ValueError("LlamaForCausalLM does not support an attention implementation through "
+                               "torch.nn.functional.scaled_dot_product_attention yet."),
+                    MagicMock()
+                ]
+                ModelManager(model_config)
+    
+    attn_implementations = [call.kwargs["attn_implementation"] for call in mock_model_cls.from_pretrained.call_args_list]
+    assert attn_implementations == ["flash_attention_2", "sdpa", "eager"]
+    
+    # Backend wybrany w konfiguracji nie jest zastępowany
+    model_config["attn_implementation"] = "sdpa"
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            mock_model_cls.from_pretrained.side_effect = ValueError("SDPA not supported")
+            with pytest.raises(ValueError):
+                ModelManager(model_config)
+    
+    # Błąd niezwiązany z atencją jest zgłaszany od razu, bez ponownego ładowania modelu
+    del model_config["attn_implementation"]
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            with patch.object(ModelManager, "_select_attn_implementation", return_value="flash_attention_2"):
+                mock_model_cls.from_pretrained.side_effect = ValueError("Unsupported quantization config")
+                with pytest.raises(ValueError, match="Unsupported quantization config"):
+                    ModelManager(model_config)
+    assert mock_model_cls.from_pretrained.call_count == 1
+    
+    # Błąd kolejnej próby jest powiązany z pierwotnym błędem atencji
+    original_error = ValueError("LlamaForCausalLM does not support Flash Attention 2.0 yet.")
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            with patch.object(ModelManager, "_select_attn_implementation", return_value="flash_attention_2"):
+                mock_model_cls.from_pretrained.side_effect = [original_error, ValueError("Unsupported dtype")]
+                with pytest.raises(ValueError, match="Unsupported dtype") as exc_info:
+                    ModelManager(model_config)
+    assert exc_info.value.__cause__ is original_error
+
+
+def test_autocast_for_4bit_model(model_config):
+    """Test autocastu do typu obliczeń modelu 4-bitowego na GPU."""
+    import torch
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+            with patch("torch.cuda.is_available", return_value=True), \
+                    patch("torch.cuda.get_device_capability", return_value=(7, 0)):
+                with patch("torch.cuda.is_bf16_supported", return_value=False):
+                    cuda_manager = ModelManager(model_config)
+                with patch("torch.cuda.is_bf16_supported", return_value=True):
+                    ModelManager(model_config)
+    
+    # Bez CUDA autocast jest wyłączony
+    assert manager._autocast_dtype is None
+    assert not manager._autocast()._enabled
+    
+    # Na GPU obliczenia modelu 4-bitowego są wykonywane w typie obliczeń bitsandbytes
+    assert cuda_manager._autocast_dtype == torch.float16
+    
+    # Niekwantyzowane wagi są wczytywane w typie obliczeń: bfloat16, gdy GPU go obsługuje
+    load_dtypes = [call.kwargs["torch_dtype"] for call in mock_model_cls.from_pretrained.call_args_list[1:]]
+    assert load_dtypes == [torch.float16, torch.bfloat16]
+
+
+def test_device_map_selection(model_config):
+    """Test wyboru rozmieszczenia wag modelu przy wczytywaniu."""
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    
+    # Bez GPU rozmieszczenie wybiera accelerate
+    assert mock_model_cls.from_pretrained.call_args.kwargs["device_map"] == "auto"
+    
+    # Przy jednym GPU wagi trafiają bezpośrednio na nie
+    with patch("torch.cuda.is_available", return_value=True), patch("torch.cuda.device_count", return_value=1):
+        assert manager._select_device_map() == {"": 0}
+        
+        # Wartość z konfiguracji ma pierwszeństwo
+        manager.config["device_map"] = "auto"
+        assert manager._select_device_map() == "auto"
+
+
+def test_max_new_tokens_capped_by_context(model_config):
+    """Test ograniczenia liczby nowych tokenów do okna kontekstu modelu."""
+    model_config["max_new_tokens"] = 150
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            mock_model_cls.from_pretrained.return_value.config.max_position_embeddings = 1024
+            manager = ModelManager(model_config)
+    
+    # Bez parametru max_length, z pamięcią podręczną KV
+    gen_kwargs = manager._build_gen_kwargs(100)
+    assert "max_length" not in gen_kwargs
+    assert gen_kwargs["use_cache"] is True
+    assert gen_kwargs["max_new_tokens"] == 150
+    
+    # Długi prompt zostawia w oknie kontekstu miejsce tylko na 24 tokeny
+    assert manager._build_gen_kwargs(1000)["max_new_tokens"] == 24
+    
+    # Prompt wypełniający całe okno kontekstu nie może być kontynuowany
+    with pytest.raises(ValueError):
+        manager._build_gen_kwargs(1024)
+
+
+def test_prompt_exceeding_context_not_generated(model_config):
+    """Test zwrócenia odpowiedzi o błędzie bez wywołania generate dla promptu dłuższego niż kontekst."""
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer") as mock_tokenizer_cls:
+            mock_tokenizer_cls.from_pretrained.return_value = CharTokenizer()
+            mock_model_cls.from_pretrained.return_value.device = "cpu"
+            mock_model_cls.from_pretrained.return_value.config.max_position_embeddings = 16
+            manager = ModelManager(model_config)
+    
+    response = manager.generate_response("Zapytanie znacznie dłuższe niż okno kontekstu modelu")
+    
+    manager.model.generate.assert_not_called()
+    assert response == GENERATION_ERROR_RESPONSE
+    
+    # Strumieniowanie zwraca tę samą odpowiedź o błędzie zamiast zgłaszać wyjątek
+    stream = manager.generate_response_stream("Zapytanie znacznie dłuższe niż okno kontekstu modelu")
+    assert list(stream) == [GENERATION_ERROR_RESPONSE]
+    manager.model.generate.assert_not_called()
+
+
+def test_stop_sequences_encoded_once(model_config):
+    """Test jednokrotnego kodowania sekwencji zatrzymujących w jednym wywołaniu tokenizera."""
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer") as mock_tokenizer_cls:
+            tokenizer = CharTokenizer()
+            mock_tokenizer_cls.from_pretrained.return_value = tokenizer
+            mock_model_cls.from_pretrained.return_value.device = "cpu"
+            manager = ModelManager(model_config)
+    
+    manager.config["stop"] = ["ab", "c"]
+    tokenizer.encoded_texts.clear()
+    assert sorted(manager._build_gen_kwargs(100)["eos_token_id"]) == [0, ord("a"), ord("b"), ord("c")]
+    assert tokenizer.encoded_texts == ["ab", "c"]
+    
+    # Kolejne wywołania korzystają z zapamiętanych identyfikatorów
+    manager._build_gen_kwargs(100)
+    assert tokenizer.encoded_texts == ["ab", "c"]
+    
+    # Zmiana konfiguracji w trakcie działania jest uwzględniana
+    manager.config["stop"] = ["d"]
+    assert sorted(manager._build_gen_kwargs(100)["eos_token_id"]) == [0, ord("d")]
+
+
+def test_greedy_decoding_without_sampling_params(model_config):
+    """Test pomijania parametrów próbkowania przy dekodowaniu zachłannym."""
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    
+    gen_kwargs = manager._build_gen_kwargs(100)
+    assert gen_kwargs["temperature"] == 0.7
+    assert "top_p" in gen_kwargs and "top_k" in gen_kwargs
+    
+    manager.config["do_sample"] = False
+    gen_kwargs = manager._build_gen_kwargs(100)
+    assert gen_kwargs["do_sample"] is False
+    assert not {"temperature", "top_p", "top_k"} & gen_kwargs.keys()
+
+
+def test_sentence_completion_full_context(model_config):
+    """Test pominięcia dokańczania zdania, gdy okno kontekstu jest już pełne."""
+    import torch
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            mock_model_cls.from_pretrained.return_value.config.max_position_embeddings = 8
+            manager = ModelManager(model_config)
+    manager.model.device = "cpu"
+    manager.tokenizer = MagicMock()
+    manager.tokenizer.decode.return_value = "Prompt"
+    manager.tokenizer.encode.return_value = torch.ones((1, 8), dtype=torch.long)
+    
+    response = manager._ensure_sentence_completion(
+        "To jest urwana odpowiedź bez", torch.ones((1, 4), dtype=torch.long), {}
+    )
+    
+    manager.model.generate.assert_not_called()
+    assert response == "To jest urwana odpowiedź bez."
+
+
+def test_sentence_completion_appends_response_ids(model_config):
+    """Test dokańczania zdania bez ponownego dekodowania i kodowania promptu."""
+    import torch
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    manager.model = MagicMock()
+    manager.model.device = "cpu"
+    manager.tokenizer = CharTokenizer()
+    manager.tokenizer.decode = lambda ids, skip_special_tokens=True: "".join(chr(i) for i in ids)
+    manager.model.generate.side_effect = lambda input_ids, **kwargs: torch.cat(
+        [input_ids, torch.tensor([[ord(" "), ord("a"), ord(".")]])], dim=1
+    )
+    
+    prompt_ids = torch.tensor([[1, 2, 3]])
+    response = manager._ensure_sentence_completion("To jest urwana odpowiedź", prompt_ids, {})
+    
+    # Model dostaje identyfikatory promptu z dopisanymi tokenami odpowiedzi
+    completion_input_ids = manager.model.generate.call_args.args[0]
+    assert completion_input_ids[0].tolist() == [1, 2, 3] + [ord(c) for c in "To jest urwana odpowiedź"]
+    assert manager.tokenizer.encoded_texts == ["To jest urwana odpowiedź"]
+    assert response == "To jest urwana odpowiedźa."
+
+
+def test_sentence_completion_stops_at_sentence_end(model_config):
+    """Test zatrzymania dokańczania zdania na tokenie kończącym zdanie."""
+    import torch
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    manager.model = MagicMock()
+    manager.model.device = "cpu"
+    manager.tokenizer = CharTokenizer()
+    manager.tokenizer.decode = lambda ids, skip_special_tokens=True: "".join(chr(i) for i in ids)
+    manager._sentence_end_token_ids = manager._find_sentence_end_token_ids()
+    assert manager._sentence_end_token_ids == sorted(ord(c) for c in ".!?:;")
+    
+    manager.model.generate.side_effect = lambda input_ids, **kwargs: torch.cat(
+        [input_ids, torch.tensor([[ord(" "), ord("a"), ord(".")]])], dim=1
+    )
+    response = manager._ensure_sentence_completion("To jest urwana odpowiedź", torch.tensor([[1]]), {"eos_token_id": 0})
+    
+    # Tokeny kończące zdanie dołączają do tokenów zatrzymujących generowanie
+    assert manager.model.generate.call_args.kwargs["eos_token_id"] == [0] + manager._sentence_end_token_ids
+    assert response == "To jest urwana odpowiedźa."
+    
+    # min_length blokowałby te tokeny, więc wtedy lista pozostaje bez zmian
+    manager._ensure_sentence_completion("To jest urwana odpowiedź", torch.tensor([[1]]), {"eos_token_id": 0, "min_length": 50})
+    assert manager.model.generate.call_args.kwargs["eos_token_id"] == 0
+
+
+def test_static_cache_for_compiled_model(model_config):
+    """Test statycznej pamięci KV dla skompilowanego modelu."""
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    
+    assert "cache_implementation" not in manager._build_gen_kwargs(100)
+    
+    manager._model_compiled = True
+    assert manager._build_gen_kwargs(100)["cache_implementation"] == "static"
+
+
+def test_generate_response_stream(model_config):
+    """Test strumieniowego generowania odpowiedzi fragment po fragmencie."""
+    import torch
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    manager.tokenizer = CharTokenizer()
+    manager.tokenizer.decode = lambda ids, skip_special_tokens=True, **kwargs: "".join(chr(i) for i in ids)
+    manager.model = MagicMock()
+    manager.model.device = "cpu"
+    
+    def fake_generate(input_ids, attention_mask, streamer, **kwargs):
+        # Pierwsze wywołanie put przekazuje prompt, który streamer pomija
+        streamer.put(input_ids[0])
+        for char in "Cześć tato. Jak się masz?":
+            streamer.put(torch.tensor([ord(char)]))
+        streamer.end()
+    
+    manager.model.generate.side_effect = fake_generate
+    
+    stream = manager.generate_response_stream("Testowe zapytanie")
+    chunks = []
+    while True:
+        try:
+            chunks.append(next(stream))
+        except StopIteration as stop:
+            response = stop.value
+            break
+    
+    # Odpowiedź przychodzi w kilku fragmentach bez promptu
+    assert len(chunks) > 1
+    assert "".join(chunks) == "Cześć tato. Jak się masz?"
+    assert response == "Cześć tato. Jak się masz?"
+
+
+def test_generate_response_with_inference_server(model_config):
+    """Test generowania odpowiedzi przez zewnętrzny serwer inferencji (vLLM/TGI)."""
+    model_config["inference_server_url"] = "http://localhost:8000"
+    model_config["do_sample"] = False
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM.from_pretrained") as mock_model:
+        manager = ModelManager(model_config)
+    
+    # Wagi modelu nie są wczytywane lokalnie
+    mock_model.assert_not_called()
+    assert manager.model is None
+    
+    server_response = MagicMock()
+    server_response.json.return_value = {"choices": [{"index": 0, "text": "Odpowiedź z serwera.<|end_of_text|>"}]}
+    with patch.object(manager._inference_client.session, "post", return_value=server_response) as mock_post:
+        response = manager.generate_response("Testowe zapytanie")
+    
+    assert response == "Odpowiedź z serwera."
+    url = mock_post.call_args[0][0]
+    payload = mock_post.call_args[1]["json"]
+    assert url == "http://localhost:8000/v1/completions"
+    assert payload["model"] == model_config["base_model"]
+    assert "Testowe zapytanie" in payload["prompt"][0]
+    # Dekodowanie zachłanne odpowiada zerowej temperaturze
+    assert payload["temperature"] == 0.0
+
+
+def test_prefix_kv_cache_matches_full_prefill(model_config):
+    """Test ponownego użycia stanów KV prefiksu promptu przy generowaniu."""
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+    
+    torch.manual_seed(0)
+    tiny_model = LlamaForCausalLM(LlamaConfig(
+        vocab_size=0x3000, hidden_size=32, intermediate_size=64,
+        num_hidden_layers=2, num_attention_heads=2, num_key_value_heads=2
+    )).eval()
+    
+    model_config.update({"cache_prompt_prefix_kv": True, "do_sample": False, "max_new_tokens": 8})
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer") as mock_tokenizer_cls:
+            mock_tokenizer_cls.from_pretrained.return_value = CharTokenizer()
+            mock_model_cls.from_pretrained.return_value = tiny_model
+            manager = ModelManager(model_config)
+    manager.tokenizer.decode = lambda ids, skip_special_tokens=True, **kwargs: " ".join(str(i) for i in ids.tolist())
+    
+    assert manager._prefix_kv_cache is not None
+    prompt = manager._prepare_prompt("Testowe zapytanie", None)
+    input_ids = manager._encode_prompt(prompt)
+    assert "past_key_values" in manager._prefix_cache_kwargs(input_ids, {})
+    
+    cached_response = manager._generate_with_model(prompt)
+    assert cached_response
+    
+    # Zapamiętany prefiks nie jest modyfikowany przez generowanie
+    assert manager._prefix_kv_cache.get_seq_length() == len(manager._prompt_prefix_ids)
+    assert manager._generate_with_model(prompt) == cached_response
+    
+    # Wynik z zapamiętanym prefiksem jest taki sam jak przy pełnym przetworzeniu promptu
+    manager._prefix_kv_cache = None
+    assert manager._generate_with_model(prompt) == cached_response
+
+
+def test_persistent_static_cache(model_config):
+    """Test ponownego użycia jednej statycznej pamięci KV między wywołaniami generowania."""
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+    
+    torch.manual_seed(0)
+    tiny_model = LlamaForCausalLM(LlamaConfig(
+        vocab_size=0x3000, hidden_size=32, intermediate_size=64,
+        num_hidden_layers=2, num_attention_heads=2, num_key_value_heads=2
+    )).eval()
+    
+    model_config.update({"do_sample": False, "max_new_tokens": 8, "max_cache_len": 256})
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer") as mock_tokenizer_cls:
+            mock_tokenizer_cls.from_pretrained.return_value = CharTokenizer()
+            mock_model_cls.from_pretrained.return_value = tiny_model
+            manager = ModelManager(model_config)
+    manager.tokenizer.decode = lambda ids, skip_special_tokens=True, **kwargs: " ".join(str(i) for i in ids.tolist())
+    manager.tokenizer.pad_token_id = 0
+    prompt = manager._prepare_prompt("Testowe zapytanie", None)
+    
+    # Model traktowany jak skompilowany: statyczna pamięć KV alokowana przy każdym wywołaniu
+    manager._model_compiled = True
+    per_call_response = manager._generate_with_model(prompt)
+    assert per_call_response
+    
+    # Jedna pamięć KV używana ponownie daje ten sam wynik
+    manager._init_static_cache()
+    assert manager._static_cache is not None
+    with patch.object(manager._static_cache, "reset", wraps=manager._static_cache.reset) as mock_reset:
+        assert manager._generate_with_model(prompt) == per_call_response
+        assert manager._generate_with_model(prompt) == per_call_response
+    assert mock_reset.call_count == 2
+    assert not manager._static_cache_lock.locked()
+    
+    # Zajęta pamięć KV nie jest współdzielona
+    manager._static_cache_lock.acquire()
+    assert manager._static_cache_kwargs(100, manager._build_gen_kwargs(100)) == {}
+    manager._static_cache_lock.release()
+    
+    # Prompt, który się nie mieści, korzysta z własnej pamięci KV
+    assert manager._static_cache_kwargs(250, manager._build_gen_kwargs(250)) == {}
+
+
+def test_warm_up_compiled_model_buckets(model_config):
+    """Test rozgrzewania skompilowanego modelu dla każdej długości kubełka mieszczącej się w pamięci KV."""
+    import threading
+    from src.modules.model.model_manager import PROMPT_LENGTH_BUCKETS
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer") as mock_tokenizer_cls:
+            mock_tokenizer_cls.from_pretrained.return_value = CharTokenizer()
+            manager = ModelManager(model_config)
+    manager.model = MagicMock()
+    manager.model.device = "cpu"
+    manager.tokenizer.pad_token_id = 0
+    manager._model_compiled = True
+    manager._static_cache = MagicMock()
+    manager._static_cache_len = PROMPT_LENGTH_BUCKETS[-2] + 2
+    manager._static_cache_lock = threading.Lock()
+    
+    manager._warm_up_compiled_model()
+    
+    prompt_length = len(manager._prompt_token_ids(manager._prepare_prompt("Hello", None)))
+    expected = [size for size in PROMPT_LENGTH_BUCKETS[:-1] if size >= prompt_length]
+    shapes = [call.args[0].shape[1] for call in manager.model.generate.call_args_list]
+    assert shapes == expected
+    assert all(call.kwargs["past_key_values"] is manager._static_cache
+               for call in manager.model.generate.call_args_list)
+    assert manager._model_compiled is True
+    assert not manager._static_cache_lock.locked()
+
+
+def test_sentence_completion_continues_from_kv_cache(model_config):
+    """Test dokańczania zdania na podstawie pamięci KV zamiast ponownego kodowania promptu."""
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+    
+    torch.manual_seed(0)
+    tiny_model = LlamaForCausalLM(LlamaConfig(
+        vocab_size=0x3000, hidden_size=32, intermediate_size=64,
+        num_hidden_layers=2, num_attention_heads=2, num_key_value_heads=2
+    )).eval()
+    
+    model_config.update({
+        "do_sample": False, "max_new_tokens": 4, "min_length": 0, "enable_sentence_completion": True,
+        "sentence_completion_max_tokens": 4, "repetition_penalty": 1.0, "no_repeat_ngram_size": 0
+    })
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM") as mock_model_cls:
+        with patch("src.modules.model.model_manager.AutoTokenizer") as mock_tokenizer_cls:
+            mock_tokenizer_cls.from_pretrained.return_value = CharTokenizer()
+            mock_model_cls.from_pretrained.return_value = tiny_model
+            manager = ModelManager(model_config)
+    manager.tokenizer.decode = lambda ids, skip_special_tokens=True, **kwargs: " ".join(str(i) for i in ids.tolist())
+    manager.tokenizer.encode = MagicMock(wraps=manager.tokenizer.encode)
+    
+    prompt = manager._prepare_prompt("Testowe zapytanie", None)
+    input_ids = manager._encode_prompt(prompt)
+    with torch.inference_mode():
+        reference = tiny_model.generate(
+            input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=8, do_sample=False,
+            pad_token_id=0, eos_token_id=None
+        )
+    manager._gen_kwargs_template["eos_token_id"] = None
+    manager.tokenizer.encode.reset_mock()
+    
+    with patch.object(tiny_model, "generate", wraps=tiny_model.generate) as mock_generate:
+        response = manager._generate_with_model(prompt)
+    
+    # Kontynuacja dostaje wygenerowaną sekwencję i jej pamięć KV; kodowany jest tylko prompt
+    assert mock_generate.call_count == 2
+    continuation_call = mock_generate.call_args_list[1]
+    assert continuation_call.kwargs["past_key_values"] is not None
+    assert continuation_call.args[0].shape[1] == input_ids.shape[1] + 4
+    assert manager.tokenizer.encode.call_count == 1
+    
+    # Wynik jest taki sam jak przy jednym dłuższym generowaniu
+    tokens = reference[0, input_ids.shape[1]:].tolist()
+    assert response == " ".join(str(i) for i in tokens[:4]) + " " + " ".join(str(i) for i in tokens[4:]) + "."
+
+
+def test_dumps_log_record():
+    """Test serializacji rekordu logu interakcji do jednej linii JSON."""
+    import json
+    
+    record = {"query": "Cześć\nco u ciebie?", "response": "Dobrze.", "duration_seconds": 0.25, "context_length": 2}
+    line = _dumps_log_record(record)
+    
+    assert "\n" not in line
+    assert json.loads(line) == record
+
+
+def test_interaction_record_timestamp():
+    """Test znacznika czasu dodawanego przy serializacji rekordu interakcji."""
+    import json
+    from datetime import datetime
+    
+    record = _InteractionRecord({"query": "Cześć", "response": "Dobrze."})
+    data = json.loads(str(record))
+    
+    # Znacznik czasu jest pierwszym polem i odpowiada chwili utworzenia rekordu
+    assert list(data) == ["timestamp", "query", "response"]
+    assert data["timestamp"] == datetime.fromtimestamp(record.created).isoformat()
+    assert str(record) is str(record)
+
+
+def test_interaction_log_disabled(model_config, mock_model):
+    """Test pominięcia budowy rekordu interakcji, gdy log interakcji jest wyłączony."""
+    import logging
+    from src.modules.model.model_manager import llm_logger
+    
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    manager.model = mock_model
+    encode_return = MagicMock()
+    encode_return.to.return_value = encode_return
+    encode_return.shape = (1, 3)
+    manager.tokenizer = MagicMock()
+    manager.tokenizer.encode.return_value = encode_return
+    manager.tokenizer.decode.return_value = "To jest testowa odpowiedź."
+    
+    previous_level = llm_logger.level
+    llm_logger.setLevel(logging.WARNING)
+    try:
+        with patch("src.modules.model.model_manager._InteractionRecord") as mock_record:
+            response = manager.generate_response("Testowe zapytanie", [])
+    finally:
+        llm_logger.setLevel(previous_level)
+    
+    assert response == "To jest testowa odpowiedź."
+    mock_record.assert_not_called()
+
+
+def test_interaction_log_reports_loaded_model(model_config, mock_model):
+    """Test zapisu nazwy wczytanego modelu w logu interakcji."""
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    manager.model = mock_model
+    encode_return = MagicMock()
+    encode_return.to.return_value = encode_return
+    encode_return.shape = (1, 3)
+    manager.tokenizer = MagicMock()
+    manager.tokenizer.encode.return_value = encode_return
+    manager.tokenizer.decode.return_value = "To jest testowa odpowiedź."
+    
+    # Zmiana konfiguracji nie zmienia wczytanego modelu
+    model_name = manager.config["base_model"]
+    manager.config["base_model"] = "inny/model"
+    with patch("src.modules.model.model_manager._InteractionRecord") as mock_record:
+        manager.generate_response("Testowe zapytanie", [])
+    
+    assert mock_record.call_args.args[0]["model"] == model_name
+
+
+def test_main_log_duplicate_filter():
+    """Test pomijania duplikatów rekordów interakcji w głównym logu."""
+    import logging
+    from src.modules.model.model_manager import main_handler
+    
+    record = logging.LogRecord("LLM_INTERACTIONS", logging.INFO, __file__, 0, "{}", None, None)
+    assert main_handler.filter(record)
+    
+    # Gdy główny logger zapisuje już do tego samego pliku, rekord nie jest zapisywany drugi raz
+    root_handler = logging.FileHandler(main_handler.baseFilename, delay=True)
+    logging.getLogger().addHandler(root_handler)
+    try:
+        assert not main_handler.filter(record)
+    finally:
+        logging.getLogger().removeHandler(root_handler)
+        root_handler.close()
+
+
+def test_interaction_log_reaches_root_handlers_off_thread():
+    """Test przekazywania rekordów interakcji do głównego loggera w wątku nasłuchującym."""
+    import logging
+    import threading
+    from src.modules.model.model_manager import llm_logger, llm_log_listener
+    
+    class RecordingHandler(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.threads = []
+        
+        def emit(self, record):
+            self.threads.append(threading.current_thread())
+    
+    root_handler = RecordingHandler()
+    logging.getLogger().addHandler(root_handler)
+    try:
+        llm_logger.info("{}")
+        llm_log_listener.stop()
+        llm_log_listener.start()
+    finally:
+        logging.getLogger().removeHandler(root_handler)
+    
+    # Rekord trafia do handlerów głównego loggera raz, poza wątkiem generowania
+    assert llm_logger.propagate is False
+    assert len(root_handler.threads) == 1
+    assert root_handler.threads[0] is not threading.current_thread()
+
+
+def test_interaction_log_without_root_handlers():
+    """Test braku wypisywania rekordów interakcji przez logging.lastResort."""
+    import logging
+    from src.modules.model.model_manager import llm_logger, llm_log_listener
+    
+    root = logging.getLogger()
+    root_handlers = root.handlers[:]
+    root.handlers = []
+    try:
+        with patch.object(logging, "lastResort", MagicMock(level=logging.WARNING)) as mock_last_resort:
+            llm_logger.error("{}")
+            llm_log_listener.stop()
+            llm_log_listener.start()
+    finally:
+        root.handlers = root_handlers
+    
+    mock_last_resort.handle.assert_not_called()
+
+
+def test_generate_response_micro_batching(model_config):
+    """Test łączenia równoczesnych zapytań w jedno wywołanie generowania wsadowego."""
+    import threading
+    
+    model_config.update({"max_batch_size": 4, "batch_window_ms": 200})
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    
+    batches = []
+    
+    def fake_batch(queries, contexts):
+        batches.append(list(queries))
+        return [f"Odpowiedź na: {query}" for query in queries]
+    
+    results = {}
+    with patch.object(manager, "generate_responses_batch", side_effect=fake_batch):
+        threads = [
+            threading.Thread(target=lambda q=q: results.__setitem__(q, manager.generate_response(q)))
+            for q in ("Pierwsze", "Drugie", "Trzecie")
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    
+    # Wszystkie zapytania trafiły do jednej partii, a każde dostało własną odpowiedź
+    assert len(batches) == 1
+    assert sorted(batches[0]) == ["Drugie", "Pierwsze", "Trzecie"]
+    assert results == {q: f"Odpowiedź na: {q}" for q in ("Pierwsze", "Drugie", "Trzecie")}
+
+
+def test_micro_batching_single_request_path(model_config):
+    """Test, że pojedyncze zapytanie w kolejce korzysta ze zwykłej ścieżki generowania."""
+    model_config.update({"max_batch_size": 4, "batch_window_ms": 1})
+    with patch("src.modules.model.model_manager.AutoModelForCausalLM"):
+        with patch("src.modules.model.model_manager.AutoTokenizer"):
+            manager = ModelManager(model_config)
+    
+    with patch.object(manager, "generate_responses_batch") as mock_batch:
+        with patch.object(manager, "_generate_with_model", return_value="Pojedyncza odpowiedź."):
+            response = manager.generate_response("Samotne zapytanie")
+    
+    mock_batch.assert_not_called()
+    assert response == "Pojedyncza odpowiedź."
@@ -5,6 +5,7 @@ from unittest.mock import MagicMock, patch
 from typing import Dict, List, Any
 import os
 import json
+from collections import deque
 
 from src.modules.metawareness.self_improvement_manager import SelfImprovementManager
 
@@ -58,7 +59,7 @@ def test_improvement_manager_initialization(improvement_config):
         assert manager.improvement_threshold == improvement_config["improvement_threshold"]
         assert manager.max_experiment_iterations == improvement_config["max_experiment_iterations"]
         assert manager.history_file == improvement_config["history_file"]
-        assert isinstance(manager.experiments, list)
+        assert isinstance(manager.experiments, deque)
         assert len(manager.experiments) == 0
         assert isinstance(manager.improvement_history, list)
         assert len(manager.improvement_history) == 0
@@ -138,12 +139,56 @@ def test_run_experiment(improvement_config, mock_model_manager, mock_learning_ma
         assert "original_params" in results
         assert "experiment_params" in results
         
+        # Sprawdzamy, czy oryginalne parametry zostały zapamiętane i przywrócone
+        assert results["original_params"] == {"temperature": 0.7}
+        assert mock_model_manager.config["temperature"] == 0.7
+        
         # Sprawdzamy, czy eksperyment został zaktualizowany
         assert experiment["status"] == "completed"
         assert "results" in experiment
         assert experiment["results"] == results
 
 
+def test_run_experiment_restores_params_on_error(improvement_config, mock_model_manager, mock_learning_manager):
+    """Test przywrócenia parametrów modelu, gdy generowanie w eksperymencie zgłasza wyjątek."""
+    with patch("src.modules.metawareness.self_improvement_manager.os.makedirs"):
+        manager = SelfImprovementManager(improvement_config)
+        mock_model_manager.generate_response.side_effect = RuntimeError("Błąd generowania")
+        
+        experiment = {"id": 1, "hypothesis": "A", "parameters": {"temperature": 0.5}, "metrics": ["response_quality"]}
+        with pytest.raises(RuntimeError):
+            manager.run_experiment(experiment, mock_model_manager, mock_learning_manager)
+        
+        assert mock_model_manager.config["temperature"] == 0.7
+
+
+def test_run_experiments_batch(improvement_config, mock_model_manager, mock_learning_manager):
+    """Test przeprowadzania eksperymentów w partii."""
+    with patch("src.modules.metawareness.self_improvement_manager.os.makedirs"):
+        manager = SelfImprovementManager(improvement_config)
+        mock_model_manager.generate_responses_batch.side_effect = \
+            lambda queries, contexts: [f"Odpowiedź {i}" for i in range(len(queries))]
+        
+        experiments = [
+            {"id": 1, "hypothesis": "A", "parameters": {"temperature": 0.5}, "metrics": ["response_quality"]},
+            {"id": 2, "hypothesis": "B", "parameters": {"temperature": 0.9}, "metrics": ["response_quality"]},
+            {"id": 3, "hypothesis": "C", "parameters": {"temperature": 0.5}, "metrics": ["response_quality"]}
+        ]
+        
+        results = manager.run_experiments_batch(experiments, mock_model_manager, mock_learning_manager)
+        
+        # Eksperymenty o tych samych parametrach generowane są jednym wywołaniem
+        assert mock_model_manager.generate_responses_batch.call_count == 2
+        mock_model_manager.generate_response.assert_not_called()
+        
+        assert len(results) == 3
+        assert all(experiment["status"] == "completed" for experiment in experiments)
+        assert [r["experiment_params"]["temperature"] for r in results] == [0.5, 0.9, 0.5]
+        
+        # Oryginalne parametry modelu zostały przywrócone
+        assert mock_model_manager.config["temperature"] == 0.7
+
+
 def test_evaluate_experiment_results(improvement_config):
     """Test oceny wyników eksperymentu."""
     with patch("src.modules.metawareness.self_improvement_manager.os.makedirs"):
@@ -182,6 +227,37 @@ def test_evaluate_experiment_results(improvement_config):
         assert evaluation["average_improvement"] > 0
 
 
+def test_evaluate_experiments_batch(improvement_config):
+    """Test oceny wyników wielu eksperymentów jednocześnie."""
+    with patch("src.modules.metawareness.self_improvement_manager.os.makedirs"):
+        manager = SelfImprovementManager(improvement_config)
+        
+        def make_experiment(experiment_id, metrics):
+            return {"id": experiment_id, "parameters": {"temperature": 0.5}, "status": "completed",
+                    "results": {"metrics": metrics}}
+        
+        experiments = [
+            make_experiment(1, {"response_quality": 0.85, "coherence": 0.75}),
+            make_experiment(2, {"response_quality": 0.95, "coherence": 0.65}),
+            make_experiment(3, {"response_quality": 0.6}),
+            {"id": 4, "status": "planned"}
+        ]
+        expected = [manager.evaluate_experiment_results(dict(e)) for e in experiments]
+        manager._pending_successful_experiments.clear()
+        manager._pending_experiment_ids.clear()
+        
+        evaluations = manager.evaluate_experiments_batch(experiments)
+        
+        # Wyniki są zgodne z oceną pojedynczych eksperymentów
+        for evaluation, reference in zip(evaluations, expected):
+            assert evaluation["success"] == reference["success"]
+            assert evaluation["average_improvement"] == pytest.approx(reference["average_improvement"])
+            assert evaluation["improvements"] == pytest.approx(reference["improvements"])
+        
+        assert [e["success"] for e in evaluations] == [True, False, False, False]
+        assert list(manager._pending_successful_experiments) == [experiments[0]]
+
+
 def test_apply_successful_improvements(improvement_config, mock_model_manager):
     """Test aplikowania udanych ulepszeń."""
     with patch("src.modules.metawareness.self_improvement_manager.os.makedirs"), \
@@ -236,41 +312,97 @@ def test_apply_successful_improvements(improvement_config, mock_model_manager):
         assert manager.improvement_history[0]["new_value"] == 0.5
 
 
-def test_save_improvement_history(improvement_config):
-    """Test zapisywania historii usprawnień."""
+def test_apply_successful_improvements_uses_pending_index(improvement_config, mock_model_manager):
+    """Test aplikowania tylko oczekujących udanych eksperymentów."""
     with patch("src.modules.metawareness.self_improvement_manager.os.makedirs"), \
-         patch("builtins.open", create=True), \
-         patch("src.modules.metawareness.self_improvement_manager.json.dump") as mock_json_dump:
+         patch("src.modules.metawareness.self_improvement_manager.SelfImprovementManager.load_improvement_history"), \
+         patch("src.modules.metawareness.self_improvement_manager.SelfImprovementManager.save_improvement_history"):
+        manager = SelfImprovementManager(improvement_config)
+        manager.improvement_history = []
+        mock_model_manager.config = {"temperature": 0.7}
         
+        # Eksperyment udany i nieudany oceniane przez menedżera
+        successful = {"id": 1, "parameters": {"temperature": 0.5}, "status": "completed",
+                      "results": {"metrics": {"response_quality": 0.9}}}
+        failed = {"id": 2, "parameters": {"temperature": 0.9}, "status": "completed",
+                  "results": {"metrics": {"response_quality": 0.4}}}
+        manager.experiments.extend([successful, failed])
+        manager.evaluate_experiment_results(successful)
+        manager.evaluate_experiment_results(failed)
+        
+        assert list(manager._pending_successful_experiments) == [successful]
+        
+        assert manager.apply_successful_improvements(mock_model_manager) is True
+        assert mock_model_manager.config["temperature"] == 0.5
+        assert len(manager._pending_successful_experiments) == 0
+        
+        # Kolejne wywołanie nie ma już nic do zastosowania
+        assert manager.apply_successful_improvements(mock_model_manager) is False
+        assert len(manager.improvement_history) == 1
+        
+        # Zastosowany eksperyment nie wraca do kolejki po ponownej ocenie
+        assert successful["applied"] is True
+        manager.evaluate_experiment_results(successful)
+        assert len(manager._pending_successful_experiments) == 0
+
+
+def test_apply_successful_improvements_skips_duplicates(improvement_config, mock_model_manager):
+    """Test pomijania ponownego aplikowania tych samych ulepszeń."""
+    with patch("src.modules.metawareness.self_improvement_manager.os.makedirs"), \
+         patch("src.modules.metawareness.self_improvement_manager.SelfImprovementManager.load_improvement_history"), \
+         patch("src.modules.metawareness.self_improvement_manager.SelfImprovementManager.save_improvement_history"):
         manager = SelfImprovementManager(improvement_config)
+        manager.improvement_history = []
+        mock_model_manager.config = {"temperature": 0.7, "top_p": 0.9}
         
-        # Dodajemy przykładową historię ulepszeń
-        manager.improvement_history = [
-            {
-                "type": "parameter_change",
-                "parameter": "temperature",
-                "old_value": 0.7,
-                "new_value": 0.5,
-                "timestamp": 123456789,
-                "metrics_improvement": {
-                    "response_quality": 0.15,
-                    "coherence": 0.05
-                }
-            }
-        ]
+        experiment = {"id": 1, "parameters": {"temperature": 0.5, "top_p": 0.9}, "status": "completed",
+                      "results": {"metrics": {"response_quality": 0.9}}}
+        manager.experiments.append(experiment)
+        manager.evaluate_experiment_results(experiment)
+        manager.apply_successful_improvements(mock_model_manager)
         
-        # Zapisujemy historię
-        manager.save_improvement_history()
+        # top_p ma już docelową wartość, więc zapisujemy tylko zmianę temperature
+        assert [imp["parameter"] for imp in manager.improvement_history] == ["temperature"]
         
-        # Sprawdzamy, czy json.dump został wywołany z właściwymi parametrami
-        mock_json_dump.assert_called_once()
-        args, _ = mock_json_dump.call_args
-        assert args[0] == manager.improvement_history
+        # Ponowna ocena tego samego eksperymentu nie dubluje wpisów w historii
+        mock_model_manager.config["temperature"] = 0.7
+        manager.evaluate_experiment_results(experiment)
+        assert manager.apply_successful_improvements(mock_model_manager) is False
+        assert len(manager.improvement_history) == 1
 
 
-def test_load_improvement_history(improvement_config):
-    """Test wczytywania historii usprawnień."""
-    test_history = [
+def test_apply_successful_improvements_deferred_flush(improvement_config, mock_model_manager):
+    """Test odroczonego zapisu historii przy aplikowaniu ulepszeń."""
+    with patch("src.modules.metawareness.self_improvement_manager.os.makedirs"), \
+         patch("src.modules.metawareness.self_improvement_manager.SelfImprovementManager.load_improvement_history"), \
+         patch("src.modules.metawareness.self_improvement_manager.SelfImprovementManager.save_improvement_history") as mock_save:
+        manager = SelfImprovementManager(improvement_config)
+        manager.improvement_history = []
+        mock_model_manager.config = {"temperature": 0.7}
+        
+        manager.experiments.append({
+            "id": 1,
+            "parameters": {"temperature": 0.5},
+            "status": "completed",
+            "evaluation": {"success": True, "improvements": {"response_quality": 0.15}}
+        })
+        
+        # Zapis jest odroczony do wywołania flush()
+        assert manager.apply_successful_improvements(mock_model_manager, flush=False) is True
+        mock_save.assert_not_called()
+        
+        manager.flush()
+        mock_save.assert_called_once()
+
+
+def test_save_improvement_history(improvement_config, tmp_path):
+    """Test zapisywania historii usprawnień."""
+    history_file = tmp_path / "improvement_history.jsonl"
+    improvement_config["history_file"] = str(history_file)
+    manager = SelfImprovementManager(improvement_config)
+    
+    # Dodajemy przykładową historię ulepszeń
+    manager.improvement_history = [
         {
             "type": "parameter_change",
             "parameter": "temperature",
@@ -284,19 +416,109 @@ def test_load_improvement_history(improvement_config):
         }
     ]
     
+    # Zapisujemy historię
+    manager.save_improvement_history()
+    
+    # Sprawdzamy, czy każdy rekord został zapisany w osobnej linii
+    lines = history_file.read_text().splitlines()
+    assert [json.loads(line) for line in lines] == manager.improvement_history
+    
+    # Nowe rekordy są dopisywane na końcu pliku
+    manager.improvement_history.append({"type": "parameter_change", "parameter": "top_p"})
+    manager._history_dirty = True
+    manager.save_improvement_history()
+    
+    lines = history_file.read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[1])["parameter"] == "top_p"
+    assert not (tmp_path / "improvement_history.jsonl.backup").exists()
+
+
+def test_save_improvement_history_skips_unchanged(improvement_config):
+    """Test pomijania zapisu, gdy historia usprawnień się nie zmieniła."""
     with patch("src.modules.metawareness.self_improvement_manager.os.makedirs"), \
-         patch("src.modules.metawareness.self_improvement_manager.os.path.exists", return_value=True), \
-         patch("builtins.open", create=True), \
-         patch("src.modules.metawareness.self_improvement_manager.json.load", return_value=test_history):
+         patch("src.modules.metawareness.self_improvement_manager.SelfImprovementManager.load_improvement_history"), \
+         patch("builtins.open", create=True) as mock_open, \
+         patch("src.modules.metawareness.self_improvement_manager.json.dump") as mock_json_dump:
         
         manager = SelfImprovementManager(improvement_config)
+        manager.improvement_history = []
         
-        # Wczytujemy historię
-        manager.load_improvement_history()
-        
-        # Sprawdzamy, czy historia została prawidłowo wczytana
-        assert manager.improvement_history == test_history
+        # Historia nie została zmieniona - zapis powinien zostać pominięty
+        manager.save_improvement_history()
         
+        mock_open.assert_not_called()
+        mock_json_dump.assert_not_called()
+
+
+def test_compact_history_converts_legacy_file(improvement_config, tmp_path):
+    """Test atomowego przepisania historii w formacie JSON Lines z kopią poprzedniej wersji."""
+    history_file = tmp_path / "improvement_history.json"
+    history_file.write_text(json.dumps([{"type": "parameter_change", "parameter": "top_p"}], indent=2))
+    improvement_config["history_file"] = str(history_file)
+    
+    manager = SelfImprovementManager(improvement_config)
+    assert len(manager.improvement_history) == 1
+    
+    manager.improvement_history.append({"type": "parameter_change", "parameter": "temperature"})
+    manager._history_dirty = True
+    manager.save_improvement_history()
+    
+    # Plik w starym formacie został przepisany, poprzednia wersja trafiła do kopii zapasowej
+    lines = history_file.read_text().splitlines()
+    assert [json.loads(line)["parameter"] for line in lines] == ["top_p", "temperature"]
+    assert len(json.loads((tmp_path / "improvement_history.json.backup").read_text())) == 1
+    assert not (tmp_path / "improvement_history.json.tmp").exists()
+
+
+def test_load_migrates_legacy_default_history(improvement_config, tmp_path):
+    """Test przeniesienia historii ze starego pliku .json do nowego pliku .jsonl."""
+    legacy_file = tmp_path / "improvement_history.json"
+    legacy_file.write_text(json.dumps([{"type": "parameter_change", "parameter": "top_p"}], indent=2))
+    history_file = tmp_path / "improvement_history.jsonl"
+    improvement_config["history_file"] = str(history_file)
+    
+    manager = SelfImprovementManager(improvement_config)
+    
+    # Historia została wczytana i zapisana w nowym pliku w formacie JSON Lines
+    assert manager.improvement_history == [{"type": "parameter_change", "parameter": "top_p"}]
+    assert [json.loads(line)["parameter"] for line in history_file.read_text().splitlines()] == ["top_p"]
+    assert legacy_file.exists()
+    
+    # Kolejne uruchomienie korzysta już z nowego pliku
+    legacy_file.write_text("[]")
+    assert SelfImprovementManager(improvement_config).improvement_history == manager.improvement_history
+
+
+def test_load_improvement_history(improvement_config, tmp_path):
+    """Test wczytywania historii usprawnień."""
+    test_history = [
+        {
+            "type": "parameter_change",
+            "parameter": "temperature",
+            "old_value": 0.7,
+            "new_value": 0.5,
+            "timestamp": 123456789,
+            "metrics_improvement": {
+                "response_quality": 0.15,
+                "coherence": 0.05
+            }
+        }
+    ]
+    
+    history_file = tmp_path / "improvement_history.jsonl"
+    # Ostatnia linia jest niekompletna, jak po przerwanym zapisie
+    history_file.write_text(json.dumps(test_history[0]) + "\n" + '{"type": "param')
+    improvement_config["history_file"] = str(history_file)
+    
+    manager = SelfImprovementManager(improvement_config)
+    
+    # Wczytujemy historię
+    manager.load_improvement_history()
+    
+    # Sprawdzamy, czy historia została prawidłowo wczytana
+    assert manager.improvement_history == test_history
+    
 
 def test_generate_improvement_report(improvement_config):
     """Test generowania raportu z procesu samodoskonalenia."""
@@ -337,4 +559,47 @@ def test_generate_improvement_report(improvement_config):
         assert "temperature" in report
         assert "learning_rate" in report
         assert "response_quality" in report
-        assert "context_usage" in report
\ No newline at end of file
+        assert "context_usage" in report
+
+def test_generate_improvement_report_limits_items_per_type(improvement_config):
+    """Test ograniczenia raportu do najnowszych ulepszeń każdego typu."""
+    improvement_config["report_items_per_type"] = 2
+    with patch("src.modules.metawareness.self_improvement_manager.os.makedirs"):
+        manager = SelfImprovementManager(improvement_config)
+    
+    manager.improvement_history = [
+        {"type": "parameter_change", "parameter": f"param_{i}", "old_value": i,
+         "new_value": i + 1, "timestamp": i, "metrics_improvement": {}}
+        for i in range(5)
+    ]
+    
+    report = manager.generate_improvement_report()
+    
+    # Liczba ulepszeń obejmuje całą historię, ale wypisane są tylko dwa najnowsze
+    assert "Number of improvements: 5" in report
+    assert "param_2" not in report
+    assert "4. Change: param_3" in report
+    assert "5. Change: param_4" in report
+
+
+def test_experiments_are_bounded(improvement_config):
+    """Test usuwania najstarszych eksperymentów po przekroczeniu limitu."""
+    improvement_config["max_stored_experiments"] = 3
+    with patch("src.modules.metawareness.self_improvement_manager.os.makedirs"):
+        manager = SelfImprovementManager(improvement_config)
+    
+    experiments = [manager.design_experiment("Refleksja") for _ in range(5)]
+    
+    # Przechowywane są tylko trzy najnowsze eksperymenty, a identyfikatory się nie powtarzają
+    assert list(manager.experiments) == experiments[2:]
+    assert [experiment["id"] for experiment in experiments] == [1, 2, 3, 4, 5]
+    
+    # Nowe udane eksperymenty są wykrywane także po usunięciu najstarszych
+    model_manager = MagicMock()
+    model_manager.config = {"temperature": 0.7}
+    assert manager.apply_successful_improvements(model_manager, flush=False) is False
+    
+    experiment = manager.design_experiment("Refleksja")
+    experiment["evaluation"] = {"success": True, "improvements": {}, "average_improvement": 0.1}
+    assert manager.apply_successful_improvements(model_manager, flush=False) is True
+    assert model_manager.config["temperature"] == 0.5
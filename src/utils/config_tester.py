@@ -123,7 +123,7 @@ class ConfigTester:
             model_manager = ModelManager(self.config["MODEL"])
             
             # Check if model is actually on GPU
-            if hasattr(model_manager, 'model'):
+            if getattr(model_manager, 'model', None) is not None:
                 if cuda_available:
                     model_device = next(model_manager.model.parameters()).device
                     is_on_gpu = model_device.type == 'cuda'
@@ -3,63 +3,120 @@
 import re
 from typing import Optional
 
+import numpy as np
+
+_GOOD_SENTENCE_RE = re.compile(r'[A-Z][^.!?\n]{10,}[.!?]')
+
+# Substitutions replaced by a space, applied in order. They cannot all be fused into
+# one alternation: an earlier removal can create or break a later match (e.g. dropping
+# a tag between two '|' characters produces a separator the '|' pattern then removes)
+_REMOVAL_PATTERNS = [
+    # Code blocks
+    re.compile(r'```[^`]*```'),
+    re.compile(r'`{3,}'),
+    re.compile(r'`[^`\n]*`'),
+    re.compile(r'`{1,5}'),
+    # HTML/XML style tags, path-like structures (this also covers the /LIRA/ marker)
+    # and specific markers (conservative). Paths and markers cannot contain '<', and
+    # the space left by a removal is in none of these patterns, so one left-to-right
+    # scan gives the same result as three sequential passes
+    re.compile(r'</?[A-Za-z]+[^>]*>|/[A-Za-z/_.]+/|====='),
+]
+
+_SPECIAL_ONLY_LINE_RE = re.compile(r'^[^\w\s]*$', re.MULTILINE)
+_SEPARATOR_PATTERNS = [
+    re.compile(r'\|+\s*\|+'),
+    re.compile(r'#+\s*#+'),
+]
+_SPECIAL_CHAR_RE = re.compile(r'[^\w\s]')
+_WHITESPACE_RUN_RE = re.compile(r'\s{2,}')
+
+# Deletes ASCII word and whitespace characters, leaving exactly what [^\w\s] matches
+# in ASCII text; one C-level pass without building a list of matches
+_ASCII_NON_SPECIAL_DELETE = str.maketrans('', '', ''.join(
+    chr(code) for code in range(128) if not _SPECIAL_CHAR_RE.match(chr(code))
+))
+
+# Per-code-point lookup of [^\w\s] for ASCII; non-ASCII characters are classified
+# once per distinct character, so long Polish outputs avoid a regex match per character
+_ASCII_SPECIAL_LUT = np.array(
+    [bool(_SPECIAL_CHAR_RE.match(chr(code))) for code in range(128)], dtype=bool
+)
+# Below this length the fixed numpy overhead outweighs the regex scan
+VECTORIZED_COUNT_MIN_LENGTH = 256
+
+
+def count_special_chars(text: str) -> int:
+    """Counts characters that are neither word characters nor whitespace.
+
+    Args:
+        text: Text to analyze
+
+    Returns:
+        Number of characters that are neither word characters nor whitespace
+    """
+    if text.isascii():
+        return len(text.translate(_ASCII_NON_SPECIAL_DELETE))
+    # Non-ASCII letters (e.g. Polish diacritics) are word characters, so use the Unicode-aware regex
+    if len(text) < VECTORIZED_COUNT_MIN_LENGTH:
+        return len(_SPECIAL_CHAR_RE.findall(text))
+
+    # UTF-32 gives one array element per character, so the count (and the ratio
+    # derived from it) stays exact, unlike a per-byte count over UTF-8
+    code_points = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    is_ascii = code_points < 128
+    count = int(np.count_nonzero(_ASCII_SPECIAL_LUT[code_points[is_ascii]]))
+    non_ascii, occurrences = np.unique(code_points[~is_ascii], return_counts=True)
+    for code, occurrence in zip(non_ascii.tolist(), occurrences.tolist()):
+        if _SPECIAL_CHAR_RE.match(chr(code)):
+            count += occurrence
+    return count
+
+
 def cleanup_model_output(text: str, aggressive: bool = False) -> str:
     """Cleans up potentially corrupted output from language models.
 
     Args:
         text: Text to clean up
         aggressive: Whether to use more aggressive cleaning (removes more content)
-        
+
     Returns:
         Cleaned text
     """
     original_text = text
 
     # Extract good sentences
-    good_sentences = re.findall(r'[A-Z][^.!?\n]{10,}[.!?]', text)
+    good_sentences = _GOOD_SENTENCE_RE.findall(text)
     if good_sentences and len(' '.join(good_sentences)) > len(original_text) * 0.3:
         return ' '.join(good_sentences)
 
-    # Remove code blocks
-    text = re.sub(r'```[^`]*```', ' ', text, flags=re.DOTALL)
-    text = re.sub(r'`{3,}', ' ', text)
-    text = re.sub(r'`[^`\n]*`', ' ', text)
-    text = re.sub(r'`{1,5}', ' ', text)
-
-    # Remove HTML/XML style tags
-    text = re.sub(r'</?[A-Za-z]+[^>]*>', ' ', text)
-
-    # Remove path-like structures
-    text = re.sub(r'/[A-Za-z/_.]+/', ' ', text)
-
-    # Remove specific markers (conservative)
-    text = re.sub(r'/LIRA/', ' ', text)
-    text = re.sub(r'=====', ' ', text)
+    # Remove code blocks, tags, path-like structures and markers
+    for pattern in _REMOVAL_PATTERNS:
+        text = pattern.sub(' ', text)
 
     # Remove lines with only special characters
-    text = re.sub(r'^[^\w\s]*$', '', text, flags=re.MULTILINE)
+    text = _SPECIAL_ONLY_LINE_RE.sub('', text)
 
     # Remove vertical bars and separators
-    text = re.sub(r'\|+\s*\|+', ' ', text)
-    text = re.sub(r'#+\s*#+', ' ', text)
+    for pattern in _SEPARATOR_PATTERNS:
+        text = pattern.sub(' ', text)
 
     # Aggressive line cleanup if requested
     if aggressive:
         clean_lines = []
         for line in text.split('\n'):
-            special_chars = len(re.findall(r'[^\w\s]', line))
+            special_chars = count_special_chars(line)
             if len(line) > 5 and special_chars / max(1, len(line)) < 0.2:
                 clean_lines.append(line)
         if clean_lines:
             text = '\n'.join(clean_lines)
 
-    # Whitespace normalization
-    text = re.sub(r'\s{2,}', ' ', text)
-    text = re.sub(r'\n{2,}', '\n', text)
+    # Whitespace normalization (also collapses runs of newlines)
+    text = _WHITESPACE_RUN_RE.sub(' ', text)
     text = text.strip()
 
     # Return fallback if empty
-    if not text.strip() or len(text.strip()) < 10:
+    if not text or len(text) < 10:
         return "Sorry, the system generated corrupted output that could not be cleaned."
 
-    return text.strip()
+    return text
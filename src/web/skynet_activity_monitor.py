@@ -435,10 +435,6 @@ def get_recent_interactions():
 
 def get_log_entry_by_id(log_id):
     """Get detailed log entry by ID - simple and direct approach"""
-    from datetime import datetime
-    import re
-    import json
-    
     # Check both logs
     log_files = []
     if os.path.exists(INTERACTION_LOG):
@@ -522,8 +518,6 @@ def get_log_entry_by_id(log_id):
 
 def get_latest_prompt():
     """Get the latest full prompt from the logs"""
-    import re
-    
     if not os.path.exists(SYSTEM_LOG):
         return None
     